@@ -1,14 +1,40 @@
-from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
-from fastapi.responses import PlainTextResponse
-from db import Aluno as AlunoDB, HistoricoConversa, SessionLocal
+import asyncio
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from db import Aluno as AlunoDB, HistoricoConversa, SessionLocal, engine, migrar_banco
 from datetime import datetime
+import hmac
 import openai
 import os
 import logging
 import glob
-import PyPDF2
-from contextlib import contextmanager
-from sqlalchemy.exc import SQLAlchemyError
+import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from lib import analytics, contexto
+from lib.chunking import dividir_em_trechos, texto_da_parte
+from lib.lesson_cache import aula_persistida, obter_aula
+from lib.llm_gateway import GatewayIA
+from lib.metrics import AmostradorLento, MiddlewareMetricas, Registro
+from lib.nomes import extrair_nome
+from lib.outbound import Deduplicador, EnvioFalso, EnvioTwilio, FilaPorAluno, Prazo
+from lib.pdf_loader import carregar_pdf_completo
+from lib.question_bank import buscar_questao, registrar_questao
+from lib.quiz_engine import MotorQuiz, formatar_questao
+from lib.retrieval import IndiceBusca, carregar_ou_construir
+from lib.shared_cache import (
+    ESPACO_ALUNO,
+    ESPACO_INDICE,
+    BackendMemoria,
+    BackendSQLite,
+    travar_processo,
+)
+from lib import stages
+from lib.student_cache import CacheAlunos
+from lib.text_cache import CacheTextoModulos
+from lib.write_behind import FilaGravacao
 
 # Configuração de logging
 logging.basicConfig(
@@ -16,15 +42,269 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Limites de tempo (segundos) e de concorrência das chamadas externas
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Abaixo dos 15 s que o provedor espera pela resposta do webhook
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "12"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+
+# Respostas assíncronas: o webhook confirma na hora e a resposta segue pelo envio
+ASYNC_REPLIES = os.getenv("ASYNC_REPLIES", "0") == "1"
+OUTBOUND_SENDER = os.getenv("OUTBOUND_SENDER", "twilio")
+
+# Número de processos que atendem a aplicação. É a configuração do modo de vários
+# workers: uvicorn e gunicorn usam WEB_CONCURRENCY como número de workers (ver
+# Procfile), então o número de processos deve vir daqui, e não de --workers. Com
+# mais de um, o texto dos PDFs, as respostas da IA, as mensagens recebidas e as
+# travas dos alunos ficam num cache em disco comum
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH", "cache_compartilhado.db" if WEB_CONCURRENCY > 1 else ""
+)
+SHARED_CACHE = BackendSQLite(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else None
+
+# Em modo de processo único, cada processo trava este arquivo ao iniciar; um
+# segundo processo com o mesmo banco não consegue a trava e falha na inicialização
+DATABASE_FILE = engine.url.database if engine.dialect.name == "sqlite" else None
+PROCESS_LOCK_PATH = os.getenv(
+    "PROCESS_LOCK_PATH", f"{DATABASE_FILE or 'alunos.db'}.processo.lock"
+)
+
 # Configuração da API OpenAI
 client = openai.OpenAI(
-    api_key=os.getenv("OPENROUTER_API_KEY"), base_url="https://openrouter.ai/api/v1"
+    api_key=os.getenv("OPENROUTER_API_KEY"),
+    base_url=os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1"),
+    timeout=LLM_TIMEOUT,
+    max_retries=1,
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Tarefas de inicialização e encerramento da aplicação"""
+    check_worker_mode()
+    # Cria as tabelas e migra o banco; com vários workers, um migra e os outros esperam
+    migrar_banco()
+    if PRELOAD_MODULES:
+        # Extrai o texto de todos os módulos antes de atender o primeiro aluno
+        PDF_CACHE.pre_carregar(sorted(glob.glob(f"{PDF_MODULES_PATH}modulo_*.pdf")))
+    if RETRIEVAL_ENABLED:
+        global SEARCH_INDEX
+        SEARCH_INDEX = load_search_index()
+    HISTORY_QUEUE.iniciar()
+    yield
+    # Conclui as respostas assíncronas e grava as mensagens pendentes
+    REPLY_QUEUE.aguardar(WEBHOOK_TIMEOUT)
+    SUMMARY_QUEUE.aguardar(WEBHOOK_TIMEOUT)
+    HISTORY_QUEUE.parar()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Pool que executa o processamento síncrono (banco e IA) fora do event loop
+WEBHOOK_EXECUTOR = ThreadPoolExecutor(
+    max_workers=WEBHOOK_WORKERS, thread_name_prefix="webhook"
+)
+
+
+def create_outbound_sender():
+    """Canal de envio das respostas assíncronas conforme OUTBOUND_SENDER"""
+    if OUTBOUND_SENDER == "fake":
+        return EnvioFalso()
+    return EnvioTwilio(
+        os.getenv("TWILIO_ACCOUNT_SID", ""),
+        os.getenv("TWILIO_AUTH_TOKEN", ""),
+        os.getenv("TWILIO_WHATSAPP_FROM", ""),
+    )
+
+
+REPLY_SENDER = create_outbound_sender()
+
+# Turnos do modo assíncrono, processados em ordem para cada aluno
+REPLY_QUEUE = FilaPorAluno(WEBHOOK_EXECUTOR)
+
+# Atualização dos resumos de conversa em segundo plano, num pool próprio para não
+# ocupar as threads que atendem os turnos
+SUMMARY_QUEUE = FilaPorAluno(
+    ThreadPoolExecutor(
+        max_workers=int(os.getenv("SUMMARY_WORKERS", "2")),
+        thread_name_prefix="resumo",
+    )
+)
+
+# MessageSid das mensagens recebidas, para descartar reenvios do provedor
+INBOUND_DEDUP = Deduplicador(
+    SHARED_CACHE
+    or BackendMemoria(capacidade=int(os.getenv("INBOUND_DEDUP_SIZE", "50000")))
 )
-app = FastAPI()
+
+# Histórico de conversas gravado em lote por uma thread dedicada
+HISTORY_QUEUE = FilaGravacao(
+    SessionLocal,
+    HistoricoConversa,
+    tamanho_lote=int(os.getenv("HISTORY_BATCH_SIZE", "100")),
+    intervalo=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5")),
+)
+
+# Estado dos alunos ativos em memória, gravado apenas quando alterado. Com vários
+# processos, o mesmo aluno pode cair em workers diferentes: o padrão passa a ser
+# não manter alunos em memória e ler o estado do banco a cada mensagem
+STUDENT_CACHE = CacheAlunos(
+    SessionLocal,
+    AlunoDB,
+    capacidade=int(
+        os.getenv("STUDENT_CACHE_SIZE", "0" if WEB_CONCURRENCY > 1 else "10000")
+    ),
+)
+
+# Métricas no formato do Prometheus, expostas em /metrics
+METRICS = Registro()
+HTTP_SECONDS = METRICS.histograma(
+    "pjotinha_http_segundos", "Duração das requisições HTTP por rota", ("rota",)
+)
+HTTP_IN_FLIGHT = METRICS.medidor(
+    "pjotinha_http_em_andamento", "Requisições HTTP em andamento", ("rota",)
+)
+STAGE_SECONDS = METRICS.histograma(
+    "pjotinha_turno_segundos",
+    "Duração do processamento de uma mensagem por etapa do aluno",
+    ("etapa",),
+)
+OPERATION_SECONDS = METRICS.histograma(
+    "pjotinha_operacao_segundos",
+    "Duração das operações do atendimento (banco, PDFs, histórico)",
+    ("operacao",),
+)
+LLM_SECONDS = METRICS.histograma(
+    "pjotinha_ia_segundos", "Latência das chamadas à API da IA", ("modelo",)
+)
+METRICS.medidor(
+    "pjotinha_cache_hit_ratio",
+    "Proporção de acertos dos caches",
+    ("cache",),
+    funcao=lambda: {
+        "modulos": PDF_CACHE.estatisticas()["hit_ratio"],
+        "alunos": STUDENT_CACHE.estatisticas()["hit_ratio"],
+        "ia": LLM_GATEWAY.estatisticas()["hit_ratio"],
+    },
+)
+METRICS.medidor(
+    "pjotinha_pendentes",
+    "Trabalho em andamento ou aguardando nas filas",
+    ("fila",),
+    funcao=lambda: {
+        "ia": LLM_GATEWAY.estatisticas()["em_andamento"],
+        "historico": HISTORY_QUEUE.profundidade(),
+        "respostas": REPLY_QUEUE.estatisticas()["pendentes"],
+        "resumos": SUMMARY_QUEUE.estatisticas()["pendentes"],
+    },
+)
+
+# Perfilador por amostragem das mensagens que passarem do limite (0 desativa)
+SLOW_PROFILE_MS = float(os.getenv("SLOW_PROFILE_MS", "0"))
+SLOW_PROFILER = AmostradorLento(SLOW_PROFILE_MS / 1000) if SLOW_PROFILE_MS > 0 else None
+
+# Todas as chamadas à IA passam pelo gateway: cache de respostas por prompt
+# normalizado, coalescência de chamadas idênticas e limite de concorrência
+LLM_GATEWAY = GatewayIA(
+    client,
+    max_concorrencia=LLM_MAX_CONCURRENCY,
+    timeout=LLM_TIMEOUT,
+    ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+    capacidade=int(os.getenv("LLM_CACHE_SIZE", "1000")),
+    histograma=LLM_SECONDS,
+    compartilhado=SHARED_CACHE,
+)
+
+# Prompt do fallback da IA: orçamento de tokens e resumo incremental da conversa.
+# A cada SUMMARY_EVERY_TURNS turnos (aluno + Pjotinha) ainda não resumidos, as
+# mensagens antigas entram no resumo e apenas as SUMMARY_KEEP_MESSAGES mais
+# recentes continuam no prompt como mensagens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+SUMMARY_EVERY_TURNS = int(os.getenv("SUMMARY_EVERY_TURNS", "6"))
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", "4"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+SUMMARY_WINDOW = SUMMARY_KEEP_MESSAGES + 2 * SUMMARY_EVERY_TURNS
+PROFILE_FIELD_TOKENS = int(os.getenv("PROFILE_FIELD_TOKENS", "40"))
+
+# Análises e exportações (/analytics/*, cli.py exportar). As consultas leem uma
+# réplica, se configurada, ou um snapshot do SQLite refeito a cada
+# ANALYTICS_SNAPSHOT_TTL segundos; os endpoints exigem ANALYTICS_TOKEN
+ANALYTICS_TOKEN = os.getenv("ANALYTICS_TOKEN", "")
+ANALYTICS_SOURCE = analytics.FonteAnalitica(
+    engine,
+    url_replica=os.getenv("ANALYTICS_DATABASE_URL", ""),
+    caminho_snapshot=os.getenv("ANALYTICS_SNAPSHOT_PATH", "alunos_snapshot.db"),
+    validade=float(os.getenv("ANALYTICS_SNAPSHOT_TTL", "300")),
+)
+EXPORT_TABLES = {
+    "alunos": AlunoDB.__table__,
+    "historico": HistoricoConversa.__table__,
+}
 
 # Caminho para a pasta de módulos PDF
 PDF_MODULES_PATH = "modulos_pdf/"
 
+# Processos usados para extrair PDFs grandes em paralelo (1 desativa)
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", "1"))
+
+# Pré-carregar o texto de todos os PDFs na inicialização
+PRELOAD_MODULES = os.getenv("PRELOAD_MODULES", "1") == "1"
+
+# Índice de busca local usado para dar contexto do curso ao fallback da IA
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "1") == "1"
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "indice_busca/")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+SEARCH_INDEX = None
+
+# Base modular com tópicos e questões do curso
+COURSE_BASE_PATH = "base_modular_meu_primeiro_cnpj.json"
+
+# Gerar questões com a IA quando a base não tiver questões para o módulo
+QUIZ_LLM_FALLBACK = os.getenv("QUIZ_LLM_FALLBACK", "1") == "1"
+
+# Banco de questões carregado uma única vez na inicialização
+QUIZ_ENGINE = MotorQuiz.carregar(COURSE_BASE_PATH)
+
+
+def check_worker_mode():
+    """Falha se outro processo atende o mesmo banco em modo de processo único
+
+    Vários workers sem WEB_CONCURRENCY (por exemplo, com `uvicorn --workers N`)
+    manteriam alunos em memória sem cache compartilhado nem travas entre eles.
+    """
+    if WEB_CONCURRENCY > 1 or travar_processo(PROCESS_LOCK_PATH):
+        return
+    raise RuntimeError(
+        "Outro processo já atende este banco em modo de processo único. Para "
+        "vários workers, defina WEB_CONCURRENCY com o número de processos em vez "
+        "de usar --workers."
+    )
+
+
+@contextmanager
+def shared_lock(chave, espaco=0):
+    """Trava entre processos quando há cache compartilhado; sem ele, não trava"""
+    if SHARED_CACHE is None:
+        yield
+        return
+    with SHARED_CACHE.travar(chave, espaco):
+        yield
+
+
+@contextmanager
+def student_lock(sender):
+    """Serializa as mensagens do aluno no processo e, com vários workers, entre eles
+
+    A trava entre processos usa um espaço próprio, que as travas do cache (IA,
+    texto dos módulos) tomadas durante o turno nunca compartilham.
+    """
+    with STUDENT_CACHE.lock(sender), shared_lock(
+        f"aluno:{sender}", espaco=ESPACO_ALUNO
+    ):
+        yield
+
 
 @contextmanager
 def get_db_session():
@@ -37,10 +317,14 @@ def get_db_session():
 
 
 def extract_name(text):
-    """Extrai o primeiro nome de um texto usando a API OpenAI"""
+    """Extrai o primeiro nome de um texto; a IA só é usada se o texto for ambíguo"""
+    nome_local = extrair_nome(text)
+    if nome_local:
+        return nome_local
+
     try:
         prompt_nome = f"Extraia apenas o primeiro nome da seguinte frase: '{text}'. Responda apenas com o nome, sem pontuação ou informações adicionais."
-        resposta_nome = client.chat.completions.create(
+        resposta_nome = LLM_GATEWAY.completar(
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt_nome}],
             temperature=0,
@@ -60,105 +344,290 @@ def extract_name(text):
         return text
 
 
-def save_message(session, aluno_id, remetente, mensagem):
-    """Salva uma mensagem no histórico de conversas"""
-    try:
-        historico = HistoricoConversa(
-            aluno_id=aluno_id,
-            remetente=remetente,
-            mensagem=mensagem,
-            timestamp=datetime.now().isoformat(),
+def save_message(aluno_id, remetente, mensagem):
+    """Agenda a gravação de uma mensagem no histórico de conversas"""
+    with OPERATION_SECONDS.medir(operacao="historico"):
+        return HISTORY_QUEUE.enfileirar(
+            {
+                "aluno_id": aluno_id,
+                "remetente": remetente,
+                "mensagem": mensagem,
+                "timestamp": datetime.now(),
+            }
+        )
+
+
+def recent_history(session, aluno_id, limit=10, after_id=0):
+    """Últimas `limit` mensagens do aluno, da mais antiga para a mais recente
+
+    Com `after_id`, apenas mensagens posteriores a ela (ainda não resumidas).
+    """
+    consulta = session.query(HistoricoConversa).filter_by(aluno_id=aluno_id)
+    if after_id:
+        consulta = consulta.filter(HistoricoConversa.id > after_id)
+    # Ordem decrescente percorre o índice (aluno_id, timestamp) de trás para frente
+    historico = (
+        consulta.order_by(
+            HistoricoConversa.timestamp.desc(), HistoricoConversa.id.desc()
+        )
+        .limit(limit)
+        .all()
+    )
+    historico.reverse()
+    return historico
+
+
+def history_pairs(historico):
+    """Mensagens do histórico como pares (papel, texto) para a IA"""
+    return [
+        ("user" if conversa.remetente == "aluno" else "assistant", conversa.mensagem)
+        for conversa in historico
+    ]
+
+
+def update_summary(sender):
+    """Incorpora ao resumo do aluno as mensagens antigas ainda não resumidas
+
+    Executada fora do turno (SUMMARY_QUEUE); a chamada à IA é feita sem o
+    lock do aluno, e o resumo só é gravado se nenhum outro foi gravado antes.
+    """
+    with get_db_session() as session:
+        with student_lock(sender):
+            estado = STUDENT_CACHE.obter(session, sender)
+            aluno_id, resumo, resumo_ate = estado.id, estado.resumo, estado.resumo_ate
+
+        # Mensagens além das 4 janelas mais recentes não entram no resumo
+        historico = recent_history(
+            session, aluno_id, limit=4 * SUMMARY_WINDOW, after_id=resumo_ate
+        )
+        if len(historico) < SUMMARY_WINDOW:
+            return
+        antigas = historico[:-SUMMARY_KEEP_MESSAGES]
+
+        resposta = LLM_GATEWAY.completar(
+            usar_cache=False,
+            model="gpt-3.5-turbo",
+            messages=contexto.mensagens_resumo(resumo, history_pairs(antigas)),
+            temperature=0.3,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        )
+        novo_resumo = resposta.choices[0].message.content.strip()
+
+        with student_lock(sender):
+            estado = STUDENT_CACHE.obter(session, sender)
+            if estado.resumo_ate != resumo_ate:
+                return
+            estado.resumo = novo_resumo
+            estado.resumo_ate = antigas[-1].id
+            STUDENT_CACHE.salvar(session, estado)
+        logger.info(
+            f"Resumo do aluno {aluno_id} atualizado com {len(antigas)} mensagens"
         )
-        session.add(historico)
-        session.commit()
-        return True
-    except SQLAlchemyError as e:
-        logger.error(f"Erro ao salvar mensagem: {e}")
-        session.rollback()
-        return False
 
 
 def extract_text_from_pdf(pdf_path):
     """Extrai texto de um arquivo PDF"""
     try:
-        text = ""
-        with open(pdf_path, "rb") as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
-        return text
+        with OPERATION_SECONDS.medir(operacao="extracao_pdf"):
+            return carregar_pdf_completo(pdf_path, processos=PDF_EXTRACT_PROCESSES)
     except Exception as e:
         logger.error(f"Erro ao extrair texto do PDF {pdf_path}: {e}")
         return ""
 
-    # Cache simples para o conteúdo dos PDFs
 
+# Cache LRU do texto dos PDFs, invalidado quando o arquivo é alterado
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_MB", "64")) * 1024 * 1024
+PDF_CACHE = CacheTextoModulos(
+    extract_text_from_pdf, max_bytes=PDF_CACHE_MAX_BYTES, compartilhado=SHARED_CACHE
+)
 
-PDF_CACHE = {}
+# Quantidade de partes de aula por módulo
+LESSON_PARTS = 4
 
+# Quantidade de questões por quiz
+QUIZ_QUESTIONS = 5
 
-def get_module_content(module_number):
-    """Busca o conteúdo do módulo em PDF com cache"""
-    if module_number in PDF_CACHE:
-        return PDF_CACHE[module_number]
+# Limite de caracteres do trecho do módulo enviado em cada prompt
+PROMPT_TEXT_LIMIT = 4000
 
-    # Procura o arquivo PDF correspondente
+# Versão do prompt das aulas; alterar invalida as aulas já persistidas
+LESSON_PROMPT_VERSION = "trechos-1"
+
+
+def find_module_pdf(module_number):
+    """Retorna o caminho do PDF do módulo ou None se não existir"""
     pdf_pattern = f"{PDF_MODULES_PATH}modulo_{module_number}*.pdf"
-    pdf_files = glob.glob(pdf_pattern)
+    pdf_files = sorted(glob.glob(pdf_pattern))
+    return pdf_files[0] if pdf_files else None
 
-    if not pdf_files:
-        logger.warning(f"Arquivo PDF para módulo {module_number} não encontrado")
-        return "Conteúdo do módulo não encontrado."
 
-    # Extrai texto do primeiro PDF encontrado
-    pdf_text = extract_text_from_pdf(pdf_files[0])
-    if not pdf_text:
-        return "Não foi possível extrair o conteúdo do módulo."
+def get_module_chunks(module_number):
+    """Trechos do módulo em PDF, divididos uma única vez e guardados no cache"""
+    # Procura o arquivo PDF correspondente
+    pdf_path = find_module_pdf(module_number)
+
+    if not pdf_path:
+        logger.warning(f"Arquivo PDF para módulo {module_number} não encontrado")
+        return dividir_em_trechos("Conteúdo do módulo não encontrado.")
+
+    # Extrai e divide o primeiro PDF encontrado (ou reaproveita do cache)
+    with OPERATION_SECONDS.medir(operacao="texto_modulo"):
+        chunks = PDF_CACHE.trechos(pdf_path)
+    if not chunks:
+        return dividir_em_trechos("Não foi possível extrair o conteúdo do módulo.")
+
+    return chunks
+
+
+def generate_lesson_content(module_chunks, part_number, total_parts=LESSON_PARTS):
+    """Gera via IA o conteúdo de uma parte da aula (lança exceção em caso de falha)"""
+    # Apenas os trechos do módulo que correspondem a esta parte
+    part_text = texto_da_parte(
+        module_chunks, part_number, total_parts, PROMPT_TEXT_LIMIT
+    )
+    prompt = f"""
+    Com base no texto do módulo abaixo, crie o conteúdo para a parte {part_number} da aula.
+    O conteúdo deve ser adequado para mensagens de WhatsApp (curto e direto).
+    Use emoji ocasionalmente para tornar mais engajador.
+    
+    TEXTO DO MÓDULO:
+    {part_text}
+    
+    FORMATO DESEJADO:
+    - Título da parte {part_number}
+    - 3-4 parágrafos curtos com o conteúdo principal
+    - 1 exemplo prático
+    - 1 pergunta reflexiva no final
+    """
+
+    response = LLM_GATEWAY.completar(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.7,
+        max_tokens=500,
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+def lesson_fallback(part_number):
+    """Conteúdo padrão quando não é possível gerar a aula"""
+    return f"Parte {part_number}: Conteúdo sobre empreendedorismo.\n\nDigite *continuar* para avançar."
+
+
+def load_search_index():
+    """Abre o índice de busca do curso, construindo-o se necessário
+
+    Com vários processos, um worker constrói o índice enquanto os outros esperam
+    e depois apenas o abrem. A trava fica num espaço próprio porque a construção
+    lê o texto dos PDFs, que trava cada arquivo no espaço do cache.
+    """
+    try:
+        with shared_lock("indice_busca", espaco=ESPACO_INDICE):
+            return carregar_ou_construir(
+                SEARCH_INDEX_PATH, PDF_MODULES_PATH, COURSE_BASE_PATH, PDF_CACHE.obter
+            )
+    except Exception as e:
+        logger.error(f"Erro ao carregar índice de busca: {e}")
+        return None
 
-    return pdf_text
 
+def course_passages(question, include_quiz_bank=True):
+    """Trechos do material do curso mais relevantes para a pergunta do aluno
 
-def create_lesson_content(module_text, part_number):
-    """Cria conteúdo para uma aula específica com base no texto do módulo"""
+    Durante o quiz, os enunciados da base de questões ficam de fora. Se outro
+    processo (como `cli.py indexar`) publicou uma nova versão do índice, ela é
+    aberta antes da busca.
+    """
+    global SEARCH_INDEX
+    if SEARCH_INDEX is None:
+        return ""
+    if SEARCH_INDEX.substituido(SEARCH_INDEX_PATH):
+        try:
+            SEARCH_INDEX = IndiceBusca.carregar(SEARCH_INDEX_PATH)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Erro ao abrir a nova versão do índice de busca: {e}")
+    resultados = SEARCH_INDEX.buscar(
+        question, RETRIEVAL_TOP_K, incluir_base=include_quiz_bank
+    )
+    return "\n".join(f"- {passagem['texto']}" for _, passagem in resultados)
+
+
+def create_lesson_content(module_chunks, part_number, total_parts=LESSON_PARTS):
+    """Cria conteúdo para uma aula específica com base nos trechos do módulo"""
     try:
-        prompt = f"""
-        Com base no texto do módulo abaixo, crie o conteúdo para a parte {part_number} da aula.
-        O conteúdo deve ser adequado para mensagens de WhatsApp (curto e direto).
-        Use emoji ocasionalmente para tornar mais engajador.
-        
-        TEXTO DO MÓDULO:
-        {module_text[:4000]}  # Limitando para não exceder tokens
-        
-        FORMATO DESEJADO:
-        - Título da parte {part_number}
-        - 3-4 parágrafos curtos com o conteúdo principal
-        - 1 exemplo prático
-        - 1 pergunta reflexiva no final
-        """
+        return generate_lesson_content(module_chunks, part_number, total_parts)
+    except Exception as e:
+        logger.error(f"Erro ao gerar conteúdo da aula: {e}")
+        return lesson_fallback(part_number)
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500,
+
+def get_lesson_content(module_number, part_number, total_parts=LESSON_PARTS):
+    """Retorna a aula do cache persistido, gerando apenas na primeira vez"""
+    pdf_path = find_module_pdf(module_number)
+    if not pdf_path:
+        return create_lesson_content(
+            get_module_chunks(module_number), part_number, total_parts
         )
 
-        return response.choices[0].message.content.strip()
+    try:
+        return obter_aula(
+            module_number,
+            part_number,
+            pdf_path,
+            lambda: generate_lesson_content(
+                get_module_chunks(module_number), part_number, total_parts
+            ),
+            versao=LESSON_PROMPT_VERSION,
+        )
     except Exception as e:
         logger.error(f"Erro ao gerar conteúdo da aula: {e}")
-        return f"Parte {part_number}: Conteúdo sobre empreendedorismo.\n\nDigite *continuar* para avançar."
+        return lesson_fallback(part_number)
+
+
+def list_module_numbers():
+    """Lista os números dos módulos que possuem PDF em PDF_MODULES_PATH"""
+    numbers = set()
+    for pdf_path in glob.glob(f"{PDF_MODULES_PATH}modulo_*.pdf"):
+        match = re.match(r"modulo_(\d+)", os.path.basename(pdf_path))
+        if match:
+            numbers.add(match.group(1))
+    return sorted(numbers, key=int)
+
+
+def warm_lesson_cache():
+    """Pré-gera as aulas de todos os módulos do curso que possuem PDF
+
+    Retorna quantas aulas estão persistidas ao final; partes em que a IA falhou
+    recebem o texto de fallback, que não é salvo, e não entram na contagem.
+    """
+    total = 0
+    for stage in STAGES.values():
+        pdf_path = find_module_pdf(stage.modulo) if stage.tipo == stages.AULA else None
+        if pdf_path:
+            get_lesson_content(stage.modulo, stage.numero, stage.total)
+            if aula_persistida(
+                stage.modulo, stage.numero, pdf_path, versao=LESSON_PROMPT_VERSION
+            ):
+                total += 1
+    return total
 
 
-def generate_enade_question(module_text, question_number):
+def generate_enade_question(
+    module_chunks, question_number, total_questions=QUIZ_QUESTIONS
+):
     """Gera uma questão de nível ENADE com base no conteúdo do módulo"""
     try:
+        # Cada questão usa um trecho diferente do módulo
+        module_excerpt = texto_da_parte(
+            module_chunks, question_number, total_questions, PROMPT_TEXT_LIMIT
+        )
         prompt = f"""
         Com base no texto do módulo abaixo, crie UMA questão de múltipla escolha de nível ENADE (alta complexidade, exigindo análise crítica).
         A questão deve avaliar compreensão profunda e aplicação do conhecimento, não apenas memorização.
         
         TEXTO DO MÓDULO:
-        {module_text[:4000]}  # Limitando para não exceder tokens
+        {module_excerpt}
         
         FORMATO DESEJADO:
         Questão {question_number}: [texto da questão com um cenário ou caso prático]
@@ -172,7 +641,7 @@ def generate_enade_question(module_text, question_number):
         A resposta correta é a letra C. [Esta linha é para seu conhecimento, não inclua no resultado final]
         """
 
-        response = client.chat.completions.create(
+        response = LLM_GATEWAY.completar(
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
@@ -199,214 +668,343 @@ def generate_enade_question(module_text, question_number):
         return {"question_text": question_only, "correct_answer": correct_answer}
     except Exception as e:
         logger.error(f"Erro ao gerar questão ENADE: {e}")
+        return enade_fallback(question_number)
+
+
+def enade_fallback(question_number):
+    """Questão padrão quando não há questão na base nem geração pela IA"""
+    return {
+        "question_text": f"Questão {question_number}: O que é empreendedorismo?\n\nA) Processo de abrir empresas\nB) Estudo de mercados\nC) Identificação e exploração de oportunidades\nD) Gestão financeira\nE) Nenhuma das anteriores",
+        "correct_answer": "C",
+    }
+
+
+def get_quiz_question(module_number, question_number, total_questions=QUIZ_QUESTIONS):
+    """Busca a questão na base modular e, se não houver, gera com a IA"""
+    question = QUIZ_ENGINE.questao_do_quiz(module_number, question_number)
+    if question:
         return {
-            "question_text": f"Questão {question_number}: O que é empreendedorismo?\n\nA) Processo de abrir empresas\nB) Estudo de mercados\nC) Identificação e exploração de oportunidades\nD) Gestão financeira\nE) Nenhuma das anteriores",
-            "correct_answer": "C",
+            "question_text": formatar_questao(question, question_number),
+            "correct_answer": question.resposta,
+            "letters": question.letras,
+            "from_bank": True,
         }
 
+    if not QUIZ_LLM_FALLBACK:
+        return enade_fallback(question_number)
 
-def get_course_content(etapa, aluno_profile=None):
-    """Retorna o conteúdo do curso para a etapa atual"""
-    # Extrair informações da etapa
-    parts = etapa.split("_")
+    module_chunks = get_module_chunks(module_number)
+    return generate_enade_question(module_chunks, question_number, total_questions)
 
-    # Processando etapas de módulo
-    if len(parts) >= 3 and parts[0] == "modulo" and parts[1] == "pdf":
-        module_number = parts[2]
-        part_number = int(parts[3]) if len(parts) > 3 else 1
 
-        # Obter conteúdo do módulo
-        module_text = get_module_content(module_number)
+def letter_options(letters="ABCDE"):
+    """Alternativas por extenso para as mensagens (A, B, C ou D)"""
+    return (
+        ", ".join(letters[:-1]) + f" ou {letters[-1]}" if len(letters) > 1 else letters
+    )
 
-        # Criar conteúdo específico para a parte
-        content = create_lesson_content(module_text, part_number)
 
-        # Determinar próxima etapa
-        if part_number < 4:  # Supondo 4 partes por módulo
-            next_stage = f"modulo_pdf_{module_number}_{part_number + 1}"
-        else:
-            next_stage = f"quiz_modulo_{module_number}_1"  # Ir para o quiz
+def answer_instructions(letters="ABCDE"):
+    """Instrução para o aluno responder com uma das letras da questão"""
+    return (
+        f"\n\nResponda com a letra da alternativa correta ({letter_options(letters)})."
+    )
 
-        return {
-            "texto": content,
-            "proxima": next_stage,
-            "modulo_texto": module_text,  # Passar o texto completo para uso posterior
-        }
 
-    # Processando etapas de quiz
-    elif len(parts) >= 3 and parts[0] == "quiz" and parts[1] == "modulo":
-        module_number = parts[2]
-        question_number = int(parts[3]) if len(parts) > 3 else 1
+def course_modules():
+    """Módulos do curso em ordem com (número, partes da aula, questões do quiz)
+
+    Os módulos vêm da base modular e dos PDFs disponíveis; as quantidades vêm da
+    configuração do módulo na base, com LESSON_PARTS e QUIZ_QUESTIONS como padrão.
+    """
+    numbers = set(QUIZ_ENGINE.modulos()) | set(list_module_numbers())
+    modules = []
+    for module_number in sorted(numbers, key=int):
+        config = QUIZ_ENGINE.config_modulo(module_number)
+        modules.append(
+            (
+                module_number,
+                int(config.get("partes", LESSON_PARTS)),
+                int(config.get("questoes_quiz", QUIZ_QUESTIONS)),
+            )
+        )
+    return modules
+
+
+# Coleta de perfil: (etapa, campo do perfil, resposta após salvar o campo)
+PROFILE_STEPS = (
+    ("perfil_nome", "nome", "Prazer em te conhecer, {nome}! Qual o seu curso?"),
+    ("perfil_curso", "curso", "Qual semestre você está atualmente?"),
+    ("perfil_semestre", "semestre", "Quais são seus interesses no empreendedorismo?"),
+    (
+        "perfil_interesses",
+        "interesses",
+        "Prazer em te conhecer, {nome}! Está pronto para começar? Digite *continuar* para iniciar!",
+    ),
+)
+
+# Grafo de etapas do curso compilado uma única vez na inicialização
+STAGES = stages.compilar_etapas(PROFILE_STEPS, course_modules())
 
-        # Obter conteúdo do módulo para o quiz
-        module_text = get_module_content(module_number)
 
-        # Gerar questão
-        question_data = generate_enade_question(module_text, question_number)
+def resolve_stage(etapa):
+    """Etapa compilada a partir do nome salvo no aluno (None se desconhecida)"""
+    stage = STAGES.get(etapa)
+    if stage is None and etapa.startswith(("modulo_", "quiz_")):
+        # Alunos salvos em módulos que não existem mais no curso
+        return STAGES[stages.ETAPA_CONCLUIDO]
+    return stage
 
-        # Determinar próxima etapa
-        if question_number < 5:  # Supondo 5 questões por quiz
-            next_stage = f"quiz_modulo_{module_number}_{question_number + 1}"
-        else:
-            next_module = int(module_number) + 1
-            next_stage = f"modulo_pdf_{next_module}_1"  # Ir para o próximo módulo
 
+def stage_module(etapa):
+    """Rótulo do módulo em que o aluno está, para agrupar as análises"""
+    stage = resolve_stage(etapa) if etapa else None
+    if stage is None:
+        return "desconhecida"
+    if stage.modulo is not None:
+        return f"modulo_{stage.modulo}"
+    return "concluido" if stage.tipo == stages.FIM else "nao_iniciado"
+
+
+def stage_funnel(engine_analitica):
+    """Funil de etapas do curso, das etapas salvas nos alunos"""
+    return analytics.funil_etapas(
+        engine_analitica,
+        AlunoDB.__table__,
+        list(STAGES),
+        resolver=lambda etapa: getattr(resolve_stage(etapa or ""), "nome", None),
+    )
+
+
+def module_scores(engine_analitica):
+    """Distribuição da pontuação por módulo em que os alunos estão"""
+    return analytics.pontuacao_por_modulo(
+        engine_analitica, AlunoDB.__table__, stage_module
+    )
+
+
+def get_course_content(stage, aluno_profile=None):
+    """Retorna o conteúdo do curso para a etapa atual"""
+    # Aula: conteúdo específico para a parte (cache persistido por módulo/parte/PDF)
+    if stage.tipo == stages.AULA:
+        return {
+            "texto": get_lesson_content(stage.modulo, stage.numero, stage.total),
+            "proxima": stage.proxima,
+        }
+
+    # Quiz: questão da base modular em memória (IA apenas como fallback)
+    if stage.tipo == stages.QUIZ:
+        question_data = get_quiz_question(stage.modulo, stage.numero, stage.total)
         return {
             "texto": question_data["question_text"],
-            "proxima": next_stage,
+            "proxima": stage.proxima,
             "resposta_correta": question_data["correct_answer"],
+            "alternativas": question_data.get("letters") or "ABCDE",
+            "questao_base": question_data.get("from_bank", False),
         }
 
-    # Fallback para etapas não reconhecidas
+    # Fallback para etapas sem conteúdo do curso
     return {
         "texto": "Conteúdo não encontrado. Digite *menu* para ver as opções disponíveis.",
         "proxima": "menu",
     }
 
 
-@app.post("/webhook")
-async def webhook(request: Request, background_tasks: BackgroundTasks):
-    try:
-        form = await request.form()
-        incoming_msg = form.get("Body", "").strip()
-        sender = form.get("From", "")
+def get_stage_content(session, aluno_id, stage, aluno_profile=None, pending=None):
+    """Busca o conteúdo da etapa e registra a questão enviada ao aluno, se houver
 
-        if not sender or not incoming_msg:
-            logger.warning("Mensagem ou remetente vazios")
-            return PlainTextResponse("Não foi possível processar a mensagem.")
-
-        logger.info(f"Mensagem recebida de {sender}: {incoming_msg}")
-
-        with get_db_session() as session:
-            # Buscar ou criar aluno
-            aluno_db = session.query(AlunoDB).filter_by(numero_whatsapp=sender).first()
-            if not aluno_db:
-                logger.info(f"Criando novo aluno para {sender}")
-                aluno_db = AlunoDB(
-                    numero_whatsapp=sender, etapa="inicio", perfil={}, pontuacao=0
-                )
-                session.add(aluno_db)
-                session.commit()
-
-            # Estrutura do aluno
-            aluno = {
-                "etapa": aluno_db.etapa,
-                "profile": aluno_db.perfil or {},
-                "pontuacao": aluno_db.pontuacao or 0,
-            }
+    Com `pending` (lista do turno), o registro só é feito quando o turno é
+    confirmado, junto com as demais gravações.
+    """
+    conteudo = get_course_content(stage, aluno_profile)
+    # Questões da base modular são corrigidas direto da memória
+    if "resposta_correta" in conteudo and not conteudo["questao_base"]:
 
-            # Salvar mensagem do aluno
-            save_message(session, aluno_db.id, "aluno", incoming_msg)
-
-            # Lógica de processamento por etapa
-            resposta = ""
-
-            # Início do curso e coleta de perfil
-            if aluno["etapa"] == "inicio":
-                aluno["etapa"] = "perfil_nome"
-                resposta = "Olá! Sou o Pjotinha, seu instrutor no curso Meu Primeiro CNPJ! Qual o seu nome?"
-
-            elif aluno["etapa"] == "perfil_nome":
-                nome_extraido = extract_name(incoming_msg)
-                aluno["profile"]["nome"] = nome_extraido
-                aluno["etapa"] = "perfil_curso"
-                resposta = f"Prazer em te conhecer, {nome_extraido}! Qual o seu curso?"
-
-            elif aluno["etapa"] == "perfil_curso":
-                aluno["profile"]["curso"] = incoming_msg
-                aluno["etapa"] = "perfil_semestre"
-                resposta = "Qual semestre você está atualmente?"
-
-            elif aluno["etapa"] == "perfil_semestre":
-                aluno["profile"]["semestre"] = incoming_msg
-                aluno["etapa"] = "perfil_interesses"
-                resposta = "Quais são seus interesses no empreendedorismo?"
-
-            elif aluno["etapa"] == "perfil_interesses":
-                aluno["profile"]["interesses"] = incoming_msg
-                aluno["etapa"] = "pronto"
-                resposta = f"Prazer em te conhecer, {aluno['profile'].get('nome', 'aluno')}! Está pronto para começar? Digite *continuar* para iniciar!"
-
-            # Lógica do curso
-            elif aluno["etapa"] == "pronto" and "continuar" in incoming_msg.lower():
-                aluno["etapa"] = "modulo_pdf_1_1"
-                resposta = "Ótimo! Vamos começar com o primeiro módulo. Digite *continuar* para receber o conteúdo."
-
-            # Módulos e quizzes
-            elif aluno["etapa"].startswith(("modulo_", "quiz_")) and (
-                "continuar" in incoming_msg.lower() or "quiz" in incoming_msg.lower()
-            ):
-
-                conteudo = get_course_content(aluno["etapa"], aluno["profile"])
-
-                # Verificar se é uma etapa de quiz e processar resposta
-                if aluno["etapa"].startswith("quiz_") and incoming_msg.lower() not in [
-                    "continuar",
-                    "quiz",
-                ]:
-                    # Verificar resposta da questão anterior (se não for a primeira)
-                    parts = aluno["etapa"].split("_")
-                    if len(parts) > 3 and int(parts[3]) > 1:
-                        previous_question = f"quiz_modulo_{parts[2]}_{int(parts[3])-1}"
-                        # Carregar questão anterior para verificar resposta
-                        previous_content = get_course_content(previous_question)
-
-                        # Verificar se a resposta está correta
-                        user_answer = incoming_msg.strip().upper()
-                        if len(user_answer) == 1 and user_answer in "ABCDE":
-                            if user_answer == previous_content.get(
-                                "resposta_correta", ""
-                            ):
-                                aluno["pontuacao"] += 10
-                                resposta = "✓ Correto! +10 pontos\n\n"
-                            else:
-                                resposta = f"✗ Incorreto. A resposta correta era {previous_content.get('resposta_correta', '')}.\n\n"
-                        else:
-                            resposta = "Não entendi sua resposta. Por favor, responda com a letra (A, B, C, D ou E).\n\n"
-
-                # Adicionar o conteúdo atual da etapa
-                resposta += conteudo["texto"]
-
-                # Instruções para continuar
-                if aluno["etapa"].startswith("modulo_"):
-                    resposta += "\n\nDigite *continuar* para avançar."
-                elif aluno["etapa"].startswith("quiz_"):
-                    resposta += "\n\nResponda com a letra da alternativa correta (A, B, C, D ou E)."
-
-                # Atualizar etapa
-                aluno["etapa"] = conteudo["proxima"]
-
-            # Verificar resposta do quiz
-            elif aluno["etapa"].startswith("quiz_") and incoming_msg.upper() in "ABCDE":
-                # Verificar se a resposta está correta
-                conteudo = get_course_content(
-                    aluno["etapa"].rsplit("_", 1)[0]
-                    + "_"
-                    + str(int(aluno["etapa"].split("_")[-1]) - 1)
-                )
+        def registrar(session):
+            registrar_questao(
+                session,
+                aluno_id,
+                stage.nome,
+                conteudo["texto"],
+                conteudo["resposta_correta"],
+            )
 
-                # Verificar se a resposta está correta
-                user_answer = incoming_msg.strip().upper()
-                if user_answer == conteudo.get("resposta_correta", ""):
-                    aluno["pontuacao"] += 10
-                    resposta = "✓ Correto! +10 pontos\n\n"
-                else:
-                    resposta = f"✗ Incorreto. A resposta correta era {conteudo.get('resposta_correta', '')}.\n\n"
+        if pending is None:
+            registrar(session)
+        else:
+            pending.append(registrar)
+    return conteudo
+
+
+def get_issued_answer(session, aluno_id, stage):
+    """Letra correta e letras válidas da questão que o aluno recebeu na etapa"""
+    question = QUIZ_ENGINE.questao_do_quiz(stage.modulo, stage.numero)
+    if question:
+        return question.resposta, question.letras
+
+    questao = buscar_questao(session, aluno_id, stage.nome)
+    if questao is None:
+        # Questões enviadas antes do banco de questões existir
+        logger.warning(f"Questão da etapa {stage.nome} não registrada para {aluno_id}")
+        conteudo = get_course_content(stage)
+        return conteudo.get("resposta_correta", ""), conteudo.get(
+            "alternativas", "ABCDE"
+        )
+    # Questões geradas pela IA: as letras vêm das alternativas do texto enviado
+    letters = "".join(
+        re.findall(r"^\s*([A-E])\)", questao["question_text"] or "", re.M)
+    )
+    return questao["correct_answer"] or "", letters or "ABCDE"
 
-                # Avançar para a próxima questão ou módulo
-                next_conteudo = get_course_content(aluno["etapa"])
-                resposta += next_conteudo["texto"]
 
-                if aluno["etapa"].startswith("quiz_"):
-                    resposta += "\n\nResponda com a letra da alternativa correta (A, B, C, D ou E)."
-                else:
-                    resposta += "\n\nDigite *continuar* para avançar."
+def grade_answer(session, aluno_id, aluno, stage, incoming_msg):
+    """Corrige a resposta à questão anterior do quiz e devolve o feedback"""
+    if stage.anterior is None:
+        return ""
 
-                aluno["etapa"] = next_conteudo["proxima"]
+    # Corrigir com a questão que o aluno realmente recebeu
+    correct_answer, letters = get_issued_answer(
+        session, aluno_id, STAGES[stage.anterior]
+    )
+
+    user_answer = incoming_msg.strip().upper()
+    if len(user_answer) != 1 or user_answer not in letters:
+        return f"Não entendi sua resposta. Por favor, responda com a letra ({letter_options(letters)}).\n\n"
+    if user_answer == correct_answer:
+        aluno["pontuacao"] += 10
+        return "✓ Correto! +10 pontos\n\n"
+    return f"✗ Incorreto. A resposta correta era {correct_answer}.\n\n"
+
+
+# Tratadores por tipo de etapa: devolvem a resposta ou None quando a mensagem
+# não avança a etapa (nesse caso o aluno recebe o menu ou a resposta da IA)
+def handle_start(session, estado, aluno, stage, incoming_msg):
+    aluno["etapa"] = stage.proxima
+    return "Olá! Sou o Pjotinha, seu instrutor no curso Meu Primeiro CNPJ! Qual o seu nome?"
+
+
+def handle_profile(session, estado, aluno, stage, incoming_msg):
+    if stage.campo == "nome":
+        aluno["profile"]["nome"] = extract_name(incoming_msg)
+    else:
+        aluno["profile"][stage.campo] = incoming_msg
+    aluno["etapa"] = stage.proxima
+    return stage.mensagem.format(nome=aluno["profile"].get("nome", "aluno"))
+
+
+def handle_ready(session, estado, aluno, stage, incoming_msg):
+    if "continuar" not in incoming_msg.lower():
+        return None
+    aluno["etapa"] = stage.proxima
+    return "Ótimo! Vamos começar com o primeiro módulo. Digite *continuar* para receber o conteúdo."
+
+
+def handle_lesson(session, estado, aluno, stage, incoming_msg):
+    lowered = incoming_msg.lower()
+    if "continuar" not in lowered and "quiz" not in lowered:
+        return None
+    conteudo = get_stage_content(
+        session, estado.id, stage, aluno["profile"], aluno["pendentes"]
+    )
+    aluno["etapa"] = conteudo["proxima"]
+    return conteudo["texto"] + "\n\nDigite *continuar* para avançar."
+
+
+def handle_quiz(session, estado, aluno, stage, incoming_msg):
+    lowered = incoming_msg.lower()
+    if "continuar" in lowered or "quiz" in lowered:
+        # Pedido explícito da próxima questão; só corrige se veio junto uma resposta
+        if lowered in ("continuar", "quiz"):
+            resposta = ""
+        else:
+            resposta = grade_answer(session, estado.id, aluno, stage, incoming_msg)
+    elif incoming_msg.upper() in "ABCDE":
+        resposta = grade_answer(session, estado.id, aluno, stage, incoming_msg)
+    else:
+        return None
+
+    # Enviar a questão desta etapa e avançar para a próxima questão ou módulo
+    conteudo = get_stage_content(
+        session, estado.id, stage, aluno["profile"], aluno["pendentes"]
+    )
+    aluno["etapa"] = conteudo["proxima"]
+    return resposta + conteudo["texto"] + answer_instructions(conteudo["alternativas"])
+
+
+def handle_quiz_result(session, estado, aluno, stage, incoming_msg):
+    resposta_aluno = incoming_msg.strip()
+    if resposta_aluno.lower() in ("continuar", "quiz"):
+        resposta = ""
+    elif len(resposta_aluno) == 1 and resposta_aluno.upper() in "ABCDE":
+        resposta = grade_answer(session, estado.id, aluno, stage, resposta_aluno)
+    else:
+        return None
+
+    # Última questão corrigida: segue para o próximo módulo ou conclui o curso
+    aluno["etapa"] = stage.proxima
+    if stage.proxima == stages.ETAPA_CONCLUIDO:
+        return resposta + handle_completed(
+            session, estado, aluno, STAGES[stage.proxima], "continuar"
+        )
+    return (
+        resposta
+        + f"Você concluiu o quiz do módulo {stage.modulo}! Digite *continuar* para começar o próximo módulo."
+    )
+
+
+def handle_completed(session, estado, aluno, stage, incoming_msg):
+    if "continuar" not in incoming_msg.lower():
+        return None
+    return f"🎉 Parabéns, {aluno['profile'].get('nome', 'aluno')}! Você concluiu todos os módulos disponíveis com {aluno['pontuacao']} pontos. Digite *menu* para ver as opções."
+
+
+STAGE_HANDLERS = {
+    stages.INICIO: handle_start,
+    stages.PERFIL: handle_profile,
+    stages.PRONTO: handle_ready,
+    stages.AULA: handle_lesson,
+    stages.QUIZ: handle_quiz,
+    stages.RESULTADO: handle_quiz_result,
+    stages.FIM: handle_completed,
+}
+
+
+def process_message(sender, incoming_msg, deadline=None):
+    """Processa a mensagem do aluno de forma síncrona (executada no pool de threads)
+
+    Com `deadline` (lib.outbound.Prazo), nada é gravado se o webhook já desistiu
+    do turno; nesse caso retorna None e o aluno continua na mesma etapa. Por isso
+    todas as gravações do turno (histórico, questões emitidas, estado do aluno)
+    acontecem só depois de `deadline.confirmar()`.
+    """
+    # Um único processamento por aluno por vez; o estado vem do cache em memória
+    inicio = time.perf_counter()
+    with student_lock(sender), get_db_session() as session:
+        with OPERATION_SECONDS.medir(operacao="aluno"):
+            estado = STUDENT_CACHE.obter(session, sender)
+
+        # Estrutura do aluno (cópia: o cache só muda ao final, se a gravação der
+        # certo); "pendentes" guarda as gravações dos tratadores até a confirmação
+        aluno = {
+            "etapa": estado.etapa,
+            "profile": copy.deepcopy(estado.perfil),
+            "pontuacao": estado.pontuacao,
+            "pendentes": [],
+        }
+        resumir = False
+
+        # Uma consulta à tabela de etapas compiladas decide o tratamento
+        resposta = None
+        stage = resolve_stage(aluno["etapa"])
+        stage_label = stage.nome if stage is not None else "desconhecida"
+        if stage is not None:
+            resposta = STAGE_HANDLERS[stage.tipo](
+                session, estado, aluno, stage, incoming_msg
+            )
 
-            # Menu de opções
-            elif "menu" in incoming_msg.lower():
-                resposta = f"""
+        # Menu de opções
+        if resposta is None and "menu" in incoming_msg.lower():
+            resposta = f"""
                 🔹 MENU DO CURSO 🔹
                 
                 Olá {aluno['profile'].get('nome', 'aluno')}!
@@ -420,74 +1018,257 @@ async def webhook(request: Request, background_tasks: BackgroundTasks):
                 4️⃣ *ajuda* - Obter ajuda
                 """
 
-            # Fallback para IA
-            else:
-                # Usar IA para responder
-                try:
-                    historico_conversas = (
-                        session.query(HistoricoConversa)
-                        .filter_by(aluno_id=aluno_db.id)
-                        .order_by(HistoricoConversa.timestamp)
-                        .limit(10)  # Limitar histórico para evitar tokens excessivos
-                        .all()
-                    )
-
-                    # Preparar contexto para a IA
-                    perfil_info = f"Perfil do aluno: Nome: {aluno['profile'].get('nome', 'desconhecido')}, Curso: {aluno['profile'].get('curso', 'desconhecido')}, Semestre: {aluno['profile'].get('semestre', 'desconhecido')}, Interesses: {aluno['profile'].get('interesses', 'desconhecidos')}"
-
-                    messages = [
-                        {
-                            "role": "system",
-                            "content": f"Você é o Pjotinha, um assistente educacional especialista em empreendedorismo que está ministrando o curso 'Meu Primeiro CNPJ'. {perfil_info}. Etapa atual: {aluno['etapa']}. Mantenha respostas curtas e objetivas, adequadas para WhatsApp.",
-                        }
-                    ]
-
-                    # Adicionar histórico à conversa
-                    for conversa in historico_conversas:
-                        role = "user" if conversa.remetente == "aluno" else "assistant"
-                        messages.append({"role": role, "content": conversa.mensagem})
-
-                    # Adicionar mensagem atual
-                    messages.append({"role": "user", "content": incoming_msg})
-
-                    # Chamar API
-                    ai_response = client.chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=messages,
-                        temperature=0.7,
-                        max_tokens=500,
-                    )
-
-                    resposta = ai_response.choices[0].message.content.strip()
-
-                except Exception as e:
-                    logger.error(f"Erro na resposta da IA: {e}")
-                    resposta = (
-                        "Desculpe, tive um problema técnico. Pode perguntar novamente?"
-                    )
-
-            # Atualizar banco de dados
+        # Fallback para IA
+        elif resposta is None:
+            # Usar IA para responder
             try:
-                aluno_db.etapa = aluno["etapa"]
-                aluno_db.perfil = aluno["profile"]
-                aluno_db.pontuacao = aluno["pontuacao"]
-                session.commit()
-                logger.info(
-                    f"Aluno atualizado: {aluno_db.id}, etapa: {aluno_db.etapa}, pontos: {aluno_db.pontuacao}"
+                # Mensagens ainda não resumidas; ao acumular SUMMARY_EVERY_TURNS
+                # turnos, as antigas passam para o resumo fora deste turno
+                historico_conversas = recent_history(
+                    session, estado.id, limit=SUMMARY_WINDOW, after_id=estado.resumo_ate
+                )
+                resumir = (
+                    SUMMARY_EVERY_TURNS > 0
+                    and len(historico_conversas) >= SUMMARY_WINDOW
+                )
+
+                # Preparar contexto para a IA
+                # Campos do perfil são texto livre do aluno: limitados para que o
+                # prompt do sistema não consuma o orçamento de tokens
+                perfil = {
+                    campo: contexto.truncar(str(valor), PROFILE_FIELD_TOKENS)
+                    for campo, valor in aluno["profile"].items()
+                }
+                perfil_info = f"Perfil do aluno: Nome: {perfil.get('nome', 'desconhecido')}, Curso: {perfil.get('curso', 'desconhecido')}, Semestre: {perfil.get('semestre', 'desconhecido')}, Interesses: {perfil.get('interesses', 'desconhecidos')}"
+
+                system_prompt = f"Você é o Pjotinha, um assistente educacional especialista em empreendedorismo que está ministrando o curso 'Meu Primeiro CNPJ'. {perfil_info}. Etapa atual: {aluno['etapa']}. Mantenha respostas curtas e objetivas, adequadas para WhatsApp."
+
+                # Resumo, trechos do curso relacionados à pergunta e as mensagens
+                # mais recentes que couberem no orçamento de tokens
+                messages = contexto.montar_mensagens(
+                    system_prompt,
+                    incoming_msg,
+                    history_pairs(historico_conversas),
+                    CONTEXT_TOKEN_BUDGET,
+                    resumo=estado.resumo,
+                    trechos=course_passages(
+                        incoming_msg,
+                        include_quiz_bank=stage is None
+                        or stage.tipo not in (stages.QUIZ, stages.RESULTADO),
+                    ),
+                )
+
+                # Chamar API
+                ai_response = LLM_GATEWAY.completar(
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=500,
+                )
+
+                resposta = ai_response.choices[0].message.content.strip()
+
+            except Exception as e:
+                logger.error(f"Erro na resposta da IA: {e}")
+                resposta = (
+                    "Desculpe, tive um problema técnico. Pode perguntar novamente?"
                 )
-            except SQLAlchemyError as e:
-                logger.error(f"Erro ao atualizar aluno: {e}")
-                session.rollback()
 
-            # Salvar resposta no histórico
-            background_tasks.add_task(
-                save_message, session, aluno_db.id, "IA", resposta
+        if deadline is not None and not deadline.confirmar():
+            logger.warning(f"Turno de {sender} abandonado pelo webhook, nada gravado")
+            STAGE_SECONDS.observar(time.perf_counter() - inicio, etapa=stage_label)
+            return None
+
+        # Salvar mensagem do aluno e o que os tratadores deixaram pendente
+        save_message(estado.id, "aluno", incoming_msg)
+        for gravar in aluno["pendentes"]:
+            gravar(session)
+        if resumir:
+            SUMMARY_QUEUE.enfileirar(sender, update_summary, sender)
+
+        # Atualizar banco de dados (apenas os campos alterados)
+        estado.etapa = aluno["etapa"]
+        estado.perfil = aluno["profile"]
+        estado.pontuacao = aluno["pontuacao"]
+        with OPERATION_SECONDS.medir(operacao="commit_aluno"):
+            salvo = STUDENT_CACHE.salvar(session, estado)
+        if salvo:
+            logger.info(
+                f"Aluno atualizado: {estado.id}, etapa: {estado.etapa}, pontos: {estado.pontuacao}"
             )
 
-            return PlainTextResponse(resposta)
+        # Salvar resposta no histórico
+        save_message(estado.id, "IA", resposta)
+
+    STAGE_SECONDS.observar(time.perf_counter() - inicio, etapa=stage_label)
+    return resposta
+
+
+def process_turn(sender, incoming_msg, deadline=None):
+    """Processa a mensagem sob o perfilador de mensagens lentas, se ativo"""
+    if SLOW_PROFILER is None:
+        return process_message(sender, incoming_msg, deadline)
+    with SLOW_PROFILER.observar("process_message"):
+        return process_message(sender, incoming_msg, deadline)
+
+
+def send_reply(sender, incoming_msg):
+    """Processa a mensagem e envia a resposta pelo canal de saída (modo assíncrono)"""
+    try:
+        resposta = process_turn(sender, incoming_msg)
+    except Exception as e:
+        logger.error(f"Erro não tratado: {e}", exc_info=True)
+        resposta = "Desculpe, ocorreu um erro inesperado. Por favor, tente novamente mais tarde."
+    if not REPLY_SENDER.enviar(sender, resposta):
+        logger.error(f"Não foi possível enviar a resposta para {sender}")
+
+
+@app.get("/metrics")
+def metrics():
+    """Métricas no formato de texto do Prometheus"""
+    return Response(
+        METRICS.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Contadores dos caches de texto dos módulos, de alunos, da IA e compartilhado"""
+    return {
+        "modulos": PDF_CACHE.estatisticas(),
+        "alunos": STUDENT_CACHE.estatisticas(),
+        "ia": LLM_GATEWAY.estatisticas(),
+        "compartilhado": SHARED_CACHE.estatisticas() if SHARED_CACHE else None,
+    }
+
+
+@app.get("/historico/stats")
+def history_stats():
+    """Profundidade e latência de gravação da fila do histórico"""
+    return HISTORY_QUEUE.estatisticas()
+
+
+@app.get("/respostas/stats")
+def replies_stats():
+    """Turnos pendentes do modo assíncrono e mensagens duplicadas descartadas"""
+    return {
+        **REPLY_QUEUE.estatisticas(),
+        "duplicadas": INBOUND_DEDUP.duplicadas,
+    }
+
+
+def check_analytics_access(request: Request):
+    """Os endpoints de análise só respondem com o token de ANALYTICS_TOKEN"""
+    if not ANALYTICS_TOKEN:
+        raise HTTPException(status_code=404)
+    autorizacao = request.headers.get("authorization", "")
+    if not hmac.compare_digest(autorizacao, f"Bearer {ANALYTICS_TOKEN}"):
+        raise HTTPException(status_code=401)
+
+
+@app.get("/analytics/funil")
+def analytics_funnel(request: Request):
+    """Alunos em cada etapa do curso e conversão entre etapas"""
+    check_analytics_access(request)
+    return {
+        **stage_funnel(ANALYTICS_SOURCE.engine()),
+        "fonte": ANALYTICS_SOURCE.estatisticas(),
+    }
+
+
+@app.get("/analytics/pontuacao")
+def analytics_scores(request: Request):
+    """Distribuição da pontuação dos alunos por módulo"""
+    check_analytics_access(request)
+    return {
+        "modulos": module_scores(ANALYTICS_SOURCE.engine()),
+        "fonte": ANALYTICS_SOURCE.estatisticas(),
+    }
+
+
+@app.get("/analytics/export")
+def analytics_export(
+    request: Request,
+    tabela: str,
+    formato: str = "ndjson",
+    apos_id: int = 0,
+    lote: int = 1000,
+):
+    """Exporta alunos ou histórico em NDJSON ou CSV, enviados em blocos"""
+    check_analytics_access(request)
+    if tabela not in EXPORT_TABLES:
+        raise HTTPException(status_code=400, detail="Tabela desconhecida")
+    if formato not in analytics.FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato desconhecido")
+    return StreamingResponse(
+        analytics.exportar_tabela(
+            ANALYTICS_SOURCE.engine(),
+            EXPORT_TABLES[tabela],
+            formato,
+            lote=min(max(lote, 1), 10000),
+            apos_id=apos_id,
+        ),
+        media_type=analytics.FORMATOS[formato],
+    )
+
+
+@app.post("/webhook")
+async def webhook(request: Request):
+    try:
+        form = await request.form()
+        incoming_msg = form.get("Body", "").strip()
+        sender = form.get("From", "")
+        message_sid = form.get("MessageSid", "")
+
+        if not sender or not incoming_msg:
+            logger.warning("Mensagem ou remetente vazios")
+            return PlainTextResponse("Não foi possível processar a mensagem.")
+
+        # Reenvios do provedor (após timeout, por exemplo) não são processados de novo
+        if not INBOUND_DEDUP.novo(message_sid):
+            logger.info(f"Mensagem duplicada ignorada: {message_sid}")
+            return PlainTextResponse("")
+
+        # O texto das mensagens fica só no histórico, não nos logs
+        logger.info(f"Mensagem recebida de {sender} ({len(incoming_msg)} caracteres)")
+
+        if ASYNC_REPLIES:
+            # Confirma o recebimento; a resposta é enviada quando o turno terminar
+            REPLY_QUEUE.enfileirar(sender, send_reply, sender, incoming_msg)
+            return PlainTextResponse("")
+
+        # Banco e IA são síncronos: rodam no pool para não bloquear o event loop
+        loop = asyncio.get_running_loop()
+        prazo = Prazo()
+        turno = loop.run_in_executor(
+            WEBHOOK_EXECUTOR, process_turn, sender, incoming_msg, prazo
+        )
+        try:
+            resposta = await asyncio.wait_for(
+                asyncio.shield(turno), timeout=WEBHOOK_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            if prazo.expirar():
+                # O turno não grava nada: reenviar a mensagem é seguro
+                logger.error(f"Tempo esgotado ao processar mensagem de {sender}")
+                return PlainTextResponse(
+                    "Desculpe, estou demorando mais que o normal. Pode enviar sua mensagem novamente?"
+                )
+            # O turno já está gravando o aluno; a resposta sai em seguida
+            resposta = await turno
+        return PlainTextResponse(resposta)
 
     except Exception as e:
         logger.error(f"Erro não tratado: {e}", exc_info=True)
         return PlainTextResponse(
             "Desculpe, ocorreu um erro inesperado. Por favor, tente novamente mais tarde."
         )
+
+
+# Duração e requisições em andamento por rota; outros caminhos ficam agrupados
+app.add_middleware(
+    MiddlewareMetricas,
+    histograma=HTTP_SECONDS,
+    em_andamento=HTTP_IN_FLIGHT,
+    rotas=frozenset(route.path for route in app.routes),
+)
@@ -0,0 +1,93 @@
+"""Mede o aquecimento de N processos com e sem o cache de texto compartilhado
+
+Cada processo simula um worker do uvicorn pré-carregando o texto dos PDFs dos
+módulos. Sem cache compartilhado, todos extraem todos os PDFs; com o backend
+SQLite, cada PDF é extraído uma vez e os demais processos leem o resultado.
+
+Uso:
+    python benchmarks/bench_cache_compartilhado.py [--processos 4] [--pdfs modulos_pdf/]
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _extrair_contando(caminho_pdf):
+    from lib.pdf_loader import carregar_pdf_completo
+
+    _extrair_contando.extracoes += 1
+    return carregar_pdf_completo(caminho_pdf)
+
+
+_extrair_contando.extracoes = 0
+
+
+def aquecer(caminhos, caminho_cache, resultados):
+    from lib.shared_cache import BackendSQLite
+    from lib.text_cache import CacheTextoModulos
+
+    compartilhado = BackendSQLite(caminho_cache) if caminho_cache else None
+    inicio = time.perf_counter()
+    cache = CacheTextoModulos(_extrair_contando, compartilhado=compartilhado)
+    cache.pre_carregar(caminhos)
+    resultados.put((time.perf_counter() - inicio, _extrair_contando.extracoes))
+
+
+def rodar(caminhos, processos, caminho_cache):
+    resultados = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=aquecer, args=(caminhos, caminho_cache, resultados)
+        )
+        for _ in range(processos)
+    ]
+    inicio = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    medidas = [resultados.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    total = time.perf_counter() - inicio
+    return total, max(t for t, _ in medidas), sum(e for _, e in medidas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processos", type=int, default=4)
+    parser.add_argument("--pdfs", default=os.path.join(RAIZ, "modulos_pdf"))
+    args = parser.parse_args()
+
+    caminhos = sorted(glob.glob(os.path.join(args.pdfs, "modulo_*.pdf")))
+    if not caminhos:
+        sys.exit(f"Nenhum PDF encontrado em {args.pdfs}")
+
+    multiprocessing.set_start_method("spawn")
+    pasta = tempfile.mkdtemp(prefix="bench_cache_")
+    try:
+        for nome, caminho_cache in (
+            ("por processo", None),
+            ("compartilhado", os.path.join(pasta, "cache.db")),
+        ):
+            total, aquecimento, extracoes = rodar(
+                caminhos, args.processos, caminho_cache
+            )
+            print(
+                f"{nome:>14}: {args.processos} processos, {len(caminhos)} PDFs - "
+                f"{extracoes} extrações, aquecimento mais lento "
+                f"{aquecimento * 1000:.0f} ms (total {total:.2f} s)"
+            )
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Compara a consulta antiga do histórico com a consulta indexada das últimas N mensagens
+
+Cria um alunos.db temporário com o schema antigo (sem índice, timestamps em
+isoformat), mede a consulta antiga, aplica a migração de db.py e mede a nova.
+
+Uso:
+    python benchmarks/bench_historico.py [--linhas 1000000] [--alunos 10000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+CONSULTA_ANTIGA = (
+    "SELECT * FROM historico_conversas WHERE aluno_id = ? ORDER BY timestamp LIMIT ?"
+)
+CONSULTA_NOVA = (
+    "SELECT * FROM historico_conversas WHERE aluno_id = ? "
+    "ORDER BY timestamp DESC, id DESC LIMIT ?"
+)
+
+
+def criar_banco_antigo(caminho, linhas, alunos):
+    conn = sqlite3.connect(caminho)
+    conn.execute(
+        "CREATE TABLE historico_conversas (id INTEGER NOT NULL PRIMARY KEY, "
+        "aluno_id INTEGER, remetente VARCHAR, mensagem VARCHAR, timestamp VARCHAR)"
+    )
+    inicio = datetime(2025, 1, 1)
+    lote = []
+    for i in range(linhas):
+        lote.append(
+            (
+                random.randrange(1, alunos + 1),
+                "aluno" if i % 2 else "IA",
+                f"mensagem {i}",
+                (inicio + timedelta(seconds=i)).isoformat(),
+            )
+        )
+        if len(lote) == 50000:
+            conn.executemany(
+                "INSERT INTO historico_conversas (aluno_id, remetente, mensagem, "
+                "timestamp) VALUES (?, ?, ?, ?)",
+                lote,
+            )
+            lote.clear()
+    if lote:
+        conn.executemany(
+            "INSERT INTO historico_conversas (aluno_id, remetente, mensagem, "
+            "timestamp) VALUES (?, ?, ?, ?)",
+            lote,
+        )
+    conn.commit()
+    conn.close()
+
+
+def medir(caminho, consulta, alunos, consultas, limite):
+    conn = sqlite3.connect(caminho)
+    plano = conn.execute(f"EXPLAIN QUERY PLAN {consulta}", (1, limite)).fetchall()
+    tempos = []
+    for _ in range(consultas):
+        aluno_id = random.randrange(1, alunos + 1)
+        inicio = time.perf_counter()
+        conn.execute(consulta, (aluno_id, limite)).fetchall()
+        tempos.append(time.perf_counter() - inicio)
+    conn.close()
+    return tempos, " / ".join(linha[-1] for linha in plano)
+
+
+def resumo(nome, tempos, plano):
+    tempos = sorted(tempos)
+    print(
+        f"{nome:<8} mediana {statistics.median(tempos) * 1000:8.3f} ms  "
+        f"p99 {tempos[int(len(tempos) * 0.99)] * 1000:8.3f} ms  plano: {plano}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, default=1_000_000)
+    parser.add_argument("--alunos", type=int, default=10_000)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--limite", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        # db.py usa alunos.db no diretório atual
+        os.chdir(pasta)
+        caminho = os.path.join(pasta, "alunos.db")
+
+        inicio = time.perf_counter()
+        criar_banco_antigo(caminho, args.linhas, args.alunos)
+        print(f"{args.linhas} linhas criadas em {time.perf_counter() - inicio:.1f} s")
+
+        # A consulta antiga faz varredura completa: poucas repetições bastam
+        resumo("antiga", *medir(caminho, CONSULTA_ANTIGA, args.alunos, 20, args.limite))
+
+        inicio = time.perf_counter()
+        import db  # noqa: F401  (cria as tabelas novas e aplica as migrações)
+
+        db.engine.dispose()
+        print(f"migração aplicada em {time.perf_counter() - inicio:.1f} s")
+
+        resumo(
+            "nova",
+            *medir(caminho, CONSULTA_NOVA, args.alunos, args.consultas, args.limite),
+        )
+        os.chdir(RAIZ)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compara chamadas diretas à IA com o gateway (cache e coalescência) usando o stub
+
+Simula alunos concorrentes enviando perguntas parecidas ("o que é MEI?") e
+mede a latência por chamada e quantas requisições chegam de fato à API.
+
+Uso:
+    python benchmarks/bench_llm_gateway.py [--alunos 200] [--concorrencia 16] [--latencia 0.3]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lib.llm_gateway import GatewayIA  # noqa: E402
+from stub_llm import iniciar_stub  # noqa: E402
+
+PERGUNTAS = [
+    "o que é MEI?",
+    "O que é MEI",
+    "o que é mei ?",
+    "qual a diferença entre empreendedor e intraempreendedor?",
+    "Qual a diferença entre empreendedor e intraempreendedor",
+    "como abrir um CNPJ?",
+    "como abrir um cnpj",
+    "o que é inovação?",
+]
+
+
+def executar(nome, chamar, perguntas, concorrencia):
+    def medir(pergunta):
+        inicio = time.perf_counter()
+        chamar(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": pergunta}],
+            temperature=0.7,
+            max_tokens=500,
+        )
+        return time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concorrencia) as pool:
+        tempos = sorted(pool.map(medir, perguntas))
+    total = time.perf_counter() - inicio
+    print(
+        f"{nome:>8}: {len(tempos)} chamadas em {total:.2f} s - "
+        f"mediana {statistics.median(tempos) * 1000:.0f} ms, "
+        f"p95 {tempos[int(len(tempos) * 0.95)] * 1000:.0f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alunos", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--latencia", type=float, default=0.3)
+    args = parser.parse_args()
+
+    servidor = iniciar_stub(latencia=args.latencia)
+    client = openai.OpenAI(
+        api_key="stub",
+        base_url=f"http://127.0.0.1:{servidor.server_address[1]}/v1",
+        max_retries=0,
+    )
+    random.seed(42)
+    perguntas = [random.choice(PERGUNTAS) for _ in range(args.alunos)]
+
+    antes = servidor.requisicoes
+    executar("direto", client.chat.completions.create, perguntas, args.concorrencia)
+    print(f"          requisições à API: {servidor.requisicoes - antes}")
+
+    gateway = GatewayIA(client, max_concorrencia=args.concorrencia)
+    antes = servidor.requisicoes
+    executar("gateway", gateway.completar, perguntas, args.concorrencia)
+    print(f"          requisições à API: {servidor.requisicoes - antes}")
+    print(f"          {gateway.estatisticas()}")
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Mede a precisão e a latência da extração local do nome do aluno
+
+Uso:
+    python benchmarks/bench_nomes.py [--corpus benchmarks/corpus_nomes.tsv] [--repeticoes N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.nomes import carregar_nomes, extrair_nome  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus_nomes.tsv")
+
+
+def ler_corpus(caminho):
+    casos = []
+    with open(caminho, encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            if linha.startswith("#") or not linha.strip():
+                continue
+            mensagem, _, esperado = linha.rstrip("\n").partition("\t")
+            casos.append((mensagem, esperado or None))
+    return casos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--repeticoes", type=int, default=200)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    casos = ler_corpus(args.corpus)
+    nomes = carregar_nomes()
+
+    acertos = erros = para_ia = 0
+    for mensagem, esperado in casos:
+        obtido = extrair_nome(mensagem, nomes)
+        if obtido == esperado:
+            acertos += 1
+        elif obtido is None:
+            # Sem resposta local: o nome ainda é extraído pela IA
+            para_ia += 1
+        else:
+            erros += 1
+        if args.verbose and obtido != esperado:
+            print(f"  {mensagem!r}: esperado {esperado!r}, obtido {obtido!r}")
+
+    tempos = []
+    for _ in range(args.repeticoes):
+        for mensagem, _ in casos:
+            inicio = time.perf_counter()
+            extrair_nome(mensagem, nomes)
+            tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+
+    print(
+        f"{len(casos)} mensagens - {acertos} corretas, {erros} erradas, "
+        f"{para_ia} enviadas à IA ({acertos / len(casos):.0%} de acerto)"
+    )
+    print(
+        f"{len(tempos)} extrações - mediana {statistics.median(tempos) * 1e6:.1f} µs, "
+        f"p99 {tempos[int(len(tempos) * 0.99)] * 1e6:.1f} µs"
+    )
+
+
+if __name__ == "__main__":
+    main()
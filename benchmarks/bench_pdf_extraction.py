@@ -0,0 +1,69 @@
+"""Compara a extração de texto com PyPDF2 (caminho antigo) e PyMuPDF
+
+Uso:
+    python benchmarks/bench_pdf_extraction.py [caminho.pdf] [--repeticoes N] [--processos N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PyPDF2  # noqa: E402
+
+from lib.pdf_loader import carregar_pdf_completo  # noqa: E402
+
+
+def extrair_pypdf2(caminho_pdf):
+    """Reproduz a extração antiga do Main.py (PyPDF2 com concatenação por página)"""
+    text = ""
+    with open(caminho_pdf, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_num in range(len(pdf_reader.pages)):
+            page = pdf_reader.pages[page_num]
+            text += page.extract_text()
+    return text
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    resultado = ""
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", nargs="?", default="modulos_pdf/modulo_1.pdf")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--processos", type=int, default=1)
+    args = parser.parse_args()
+
+    candidatos = {
+        "pypdf2": lambda: extrair_pypdf2(args.pdf),
+        "pymupdf": lambda: carregar_pdf_completo(args.pdf, processos=args.processos),
+    }
+
+    print(f"{args.pdf} - {args.repeticoes} repetições")
+    print(
+        f"{'extrator':<10} {'mediana (ms)':>13} {'mínimo (ms)':>12} {'caracteres':>11}"
+    )
+    medianas = {}
+    for nome, funcao in candidatos.items():
+        tempos, texto = medir(funcao, args.repeticoes)
+        medianas[nome] = statistics.median(tempos)
+        print(
+            f"{nome:<10} {medianas[nome] * 1000:>13.1f} "
+            f"{min(tempos) * 1000:>12.1f} {len(texto):>11}"
+        )
+    print(f"ganho: {medianas['pypdf2'] / medianas['pymupdf']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Mede a latência de busca do índice BM25 usado no fallback da IA
+
+Uso:
+    python benchmarks/bench_retrieval.py [--indice indice_busca/] [--repeticoes N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.retrieval import carregar_ou_construir  # noqa: E402
+
+CONSULTAS = [
+    "o que é MEI?",
+    "qual a diferença entre empreendedor e intraempreendedor",
+    "teoria da destruição criativa de Schumpeter",
+    "quais as características de um empreendedor de sucesso",
+    "como funciona o processo empreendedor",
+    "empreendedoras mulheres e homens diferenças",
+    "o que é inovação",
+    "perfil empreendedor segundo McClelland",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--indice", default="indice_busca/")
+    parser.add_argument("--pdfs", default="modulos_pdf/")
+    parser.add_argument("--base", default="base_modular_meu_primeiro_cnpj.json")
+    parser.add_argument("--repeticoes", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    indice = carregar_ou_construir(args.indice, args.pdfs, args.base)
+    print(
+        f"índice aberto em {(time.perf_counter() - inicio) * 1000:.1f} ms - "
+        f"{len(indice.passagens)} passagens, {len(indice.vocabulario)} termos"
+    )
+
+    tempos = []
+    for _ in range(args.repeticoes):
+        for consulta in CONSULTAS:
+            inicio = time.perf_counter()
+            indice.buscar(consulta, args.k)
+            tempos.append(time.perf_counter() - inicio)
+
+    tempos.sort()
+    print(
+        f"{len(tempos)} buscas - mediana {statistics.median(tempos) * 1000:.3f} ms, "
+        f"p99 {tempos[int(len(tempos) * 0.99)] * 1000:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
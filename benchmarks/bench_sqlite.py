@@ -0,0 +1,111 @@
+"""Commits por segundo no SQLite: configuração antiga vs. engine de db.criar_engine
+
+Escritores gravam uma mensagem por commit (como o save_message antigo) enquanto
+leitores consultam o histórico, cada configuração num arquivo temporário próprio.
+
+Uso:
+    python benchmarks/bench_sqlite.py [--escritores 8] [--leitores 4] [--segundos 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def executar(engine, escritores, leitores, segundos):
+    from sqlalchemy.orm import sessionmaker
+
+    import db
+
+    db.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    parar = threading.Event()
+    contagem = {"commits": 0, "leituras": 0, "erros": 0}
+    lock = threading.Lock()
+
+    def somar(chave):
+        with lock:
+            contagem[chave] += 1
+
+    def escrever(aluno_id):
+        while not parar.is_set():
+            with Session() as session:
+                try:
+                    session.add(
+                        db.HistoricoConversa(
+                            aluno_id=aluno_id,
+                            remetente="aluno",
+                            mensagem="mensagem de teste",
+                            timestamp=datetime.now(),
+                        )
+                    )
+                    session.commit()
+                    somar("commits")
+                except Exception:
+                    session.rollback()
+                    somar("erros")
+
+    def ler(aluno_id):
+        while not parar.is_set():
+            with Session() as session:
+                try:
+                    session.query(db.HistoricoConversa).filter_by(
+                        aluno_id=aluno_id
+                    ).order_by(db.HistoricoConversa.timestamp.desc()).limit(10).all()
+                    somar("leituras")
+                except Exception:
+                    somar("erros")
+
+    threads = [threading.Thread(target=escrever, args=(i,)) for i in range(escritores)]
+    threads += [threading.Thread(target=ler, args=(i,)) for i in range(leitores)]
+    for thread in threads:
+        thread.start()
+    time.sleep(segundos)
+    parar.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {chave: valor / segundos for chave, valor in contagem.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escritores", type=int, default=8)
+    parser.add_argument("--leitores", type=int, default=4)
+    parser.add_argument("--segundos", type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        # db.py abre o banco de DATABASE_URL ao ser importado
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(pasta, 'alunos.db')}"
+        from sqlalchemy import create_engine
+
+        import db
+
+        configuracoes = {
+            "antiga": lambda url: create_engine(
+                url, connect_args={"check_same_thread": False}
+            ),
+            "ajustada": db.criar_engine,
+        }
+        print(f"{'config':<10} {'commits/s':>10} {'leituras/s':>11} {'erros/s':>8}")
+        for nome, fabrica in configuracoes.items():
+            url = f"sqlite:///{os.path.join(pasta, nome + '.db')}"
+            resultado = executar(
+                fabrica(url), args.escritores, args.leitores, args.segundos
+            )
+            print(
+                f"{nome:<10} {resultado['commits']:>10.0f} "
+                f"{resultado['leituras']:>11.0f} {resultado['erros']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Teste de carga do /webhook com jornadas de alunos e a IA simulada pelo stub
+
+Cada aluno virtual percorre a jornada completa (apresentação, aulas do módulo,
+quiz e perguntas livres) enviando uma mensagem por vez; `--concorrencia` alunos
+ficam ativos ao mesmo tempo. A aplicação roda em processo (ASGI, sem rede), com
+um banco SQLite temporário e a IA respondendo pelo stub com a latência escolhida.
+
+Ao final são mostrados p50/p95/p99 por turno, vazão, chamadas à IA e commits no
+banco por turno. O resultado é acrescentado a benchmarks/resultados/webhook.jsonl
+(arquivo local, fora do git) junto com o commit atual e comparado com a última
+execução de mesmos parâmetros.
+
+Uso:
+    python benchmarks/bench_webhook.py [--alunos 50] [--concorrencia 10] [--latencia 0.3]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_llm import iniciar_stub  # noqa: E402
+
+RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados", "webhook.jsonl")
+
+NOMES = ["Maria", "João", "Ana", "Pedro", "Juliana", "Lucas", "Beatriz", "Rafael"]
+
+PERGUNTAS_LIVRES = [
+    "o que é MEI?",
+    "como abrir um CNPJ?",
+    "qual a diferença entre empreendedor e intraempreendedor?",
+]
+
+
+def jornada(indice):
+    """Mensagens de um aluno: perfil, aulas, quiz e perguntas livres"""
+    nome = NOMES[indice % len(NOMES)]
+    mensagens = [
+        "oi",
+        f"meu nome é {nome}",
+        "Administração",
+        "5º semestre",
+        "abrir minha própria empresa",
+        "continuar",  # pronto -> primeira aula
+    ]
+    mensagens += ["continuar"] * 4  # partes da aula
+    mensagens += ["quiz"]  # primeira questão
+    # Cinco respostas (QUIZ_QUESTIONS): cada uma corrige a questão anterior e traz
+    # a próxima; a última leva ao resultado do quiz
+    mensagens += [letra for letra in "ABCAB"]
+    mensagens += PERGUNTAS_LIVRES[: 1 + indice % len(PERGUNTAS_LIVRES)]
+    mensagens += ["menu"]
+    return mensagens
+
+
+def percentil(valores_ordenados, fracao):
+    indice = min(int(len(valores_ordenados) * fracao), len(valores_ordenados) - 1)
+    return valores_ordenados[indice]
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            # "-dirty" indica alterações ainda não commitadas no momento da execução
+            ["git", "describe", "--always", "--dirty"],
+            cwd=RAIZ,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+async def executar(app, alunos, concorrencia):
+    import httpx
+
+    latencias = []
+    erros = 0
+    limite = asyncio.Semaphore(concorrencia)
+    transporte = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(
+        transport=transporte, base_url="http://bench", timeout=120
+    ) as cliente:
+
+        async def aluno(indice):
+            nonlocal erros
+            async with limite:
+                for turno, mensagem in enumerate(jornada(indice)):
+                    inicio = time.perf_counter()
+                    resposta = await cliente.post(
+                        "/webhook",
+                        data={
+                            "Body": mensagem,
+                            "From": f"whatsapp:+5500000{indice:05d}",
+                            "MessageSid": f"SM{indice:05d}{turno:03d}",
+                        },
+                    )
+                    latencias.append(time.perf_counter() - inicio)
+                    if resposta.status_code != 200 or "Desculpe" in resposta.text:
+                        erros += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(aluno(indice) for indice in range(alunos)))
+        return sorted(latencias), erros, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alunos", type=int, default=50)
+    parser.add_argument("--concorrencia", type=int, default=10)
+    parser.add_argument("--latencia", type=float, default=0.3, help="latência da IA")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--nao-salvar", action="store_true")
+    args = parser.parse_args()
+
+    stub = iniciar_stub(latencia=args.latencia, jitter=args.jitter)
+    pasta = tempfile.mkdtemp(prefix="bench_webhook_")
+    os.environ.update(
+        {
+            "DATABASE_URL": f"sqlite:///{os.path.join(pasta, 'alunos.db')}",
+            "LLM_BASE_URL": f"http://127.0.0.1:{stub.server_address[1]}/v1",
+            "OPENROUTER_API_KEY": os.getenv("OPENROUTER_API_KEY", "stub"),
+            "SEARCH_INDEX_PATH": os.path.join(pasta, "indice_busca"),
+        }
+    )
+    os.chdir(RAIZ)
+
+    import logging
+
+    from sqlalchemy import event
+
+    logging.disable(logging.INFO)
+
+    import Main
+    from db import engine
+
+    commits = 0
+
+    def contar_commit(_conexao):
+        nonlocal commits
+        commits += 1
+
+    event.listen(engine, "commit", contar_commit)
+
+    async def rodar():
+        async with Main.lifespan(Main.app):
+            requisicoes_antes, commits_antes = stub.requisicoes, commits
+            resultado = await executar(Main.app, args.alunos, args.concorrencia)
+            # O histórico é gravado em lote; os commits dele também contam
+            Main.HISTORY_QUEUE.aguardar()
+            return (
+                resultado,
+                stub.requisicoes - requisicoes_antes,
+                commits - commits_antes,
+            )
+
+    (latencias, erros, duracao), chamadas_ia, commits_turnos = asyncio.run(rodar())
+    stub.shutdown()
+
+    turnos = len(latencias)
+    resultado = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_atual(),
+        "parametros": {
+            "alunos": args.alunos,
+            "concorrencia": args.concorrencia,
+            "latencia": args.latencia,
+            "jitter": args.jitter,
+        },
+        "turnos": turnos,
+        "erros": erros,
+        "vazao": round(turnos / duracao, 2),
+        "p50_ms": round(percentil(latencias, 0.50) * 1000, 1),
+        "p95_ms": round(percentil(latencias, 0.95) * 1000, 1),
+        "p99_ms": round(percentil(latencias, 0.99) * 1000, 1),
+        "chamadas_ia_por_turno": round(chamadas_ia / turnos, 3),
+        "commits_por_turno": round(commits_turnos / turnos, 3),
+    }
+
+    print(
+        f"{turnos} turnos de {args.alunos} alunos em {duracao:.1f} s "
+        f"({resultado['vazao']} turnos/s, {erros} erros)"
+    )
+    print(
+        f"latência p50 {resultado['p50_ms']} ms, p95 {resultado['p95_ms']} ms, "
+        f"p99 {resultado['p99_ms']} ms"
+    )
+    print(
+        f"chamadas à IA por turno {resultado['chamadas_ia_por_turno']}, "
+        f"commits por turno {resultado['commits_por_turno']}"
+    )
+
+    anterior = ultimo_resultado(resultado["parametros"])
+    if anterior:
+        print(f"comparado com {anterior['commit']} ({anterior['data']}):")
+        for chave in ("p50_ms", "p95_ms", "p99_ms", "vazao", "chamadas_ia_por_turno"):
+            if anterior.get(chave):
+                variacao = (resultado[chave] - anterior[chave]) / anterior[chave]
+                print(
+                    f"  {chave}: {anterior[chave]} -> {resultado[chave]} ({variacao:+.0%})"
+                )
+
+    if not args.nao_salvar:
+        os.makedirs(os.path.dirname(RESULTADOS), exist_ok=True)
+        with open(RESULTADOS, "a", encoding="utf-8") as arquivo:
+            arquivo.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+
+
+def ultimo_resultado(parametros):
+    """Última execução salva com os mesmos parâmetros, ou None"""
+    if not os.path.exists(RESULTADOS):
+        return None
+    anterior = None
+    with open(RESULTADOS, encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            registro = json.loads(linha)
+            if registro.get("parametros") == parametros:
+                anterior = registro
+    return anterior
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Servidor local compatível com a API de chat da OpenAI, para testes e benchmarks
+
+Responde a POST /v1/chat/completions com uma resposta fixa após uma latência
+configurável, sem custo e sem rede. Questões ENADE recebem alternativas e a
+linha da resposta correta, e pedidos de nome recebem um nome. Com `status_erro`
+definido, todas as chamadas respondem com esse status HTTP.
+
+Uso:
+    python benchmarks/stub_llm.py [--porta 8089] [--latencia 0.5] [--jitter 0.1]
+
+Para apontar a aplicação para o stub:
+    LLM_BASE_URL=http://127.0.0.1:8089/v1 OPENROUTER_API_KEY=stub uvicorn Main:app
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUESTAO = (
+    "Questão 1: Uma empreendedora percebe uma demanda não atendida no bairro. "
+    "Qual atitude melhor representa o comportamento empreendedor?\n\n"
+    "A) Esperar o mercado amadurecer\nB) Copiar o concorrente mais próximo\n"
+    "C) Validar a oportunidade com clientes e agir\nD) Abrir a empresa sem planejamento\n"
+    "E) Desistir pelo risco envolvido\n"
+    "A resposta correta é a letra C."
+)
+
+
+def resposta_para(prompt: str) -> str:
+    if "ENADE" in prompt:
+        return QUESTAO
+    if "primeiro nome" in prompt:
+        return "Maria"
+    return (
+        "📘 Parte do curso\n\nEmpreender é identificar oportunidades e "
+        "transformá-las em valor. Pense em um problema do seu dia a dia: "
+        "como você o resolveria?"
+    )
+
+
+class ServidorStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, latencia=0.5, jitter=0.0):
+        super().__init__(endereco, ManipuladorStub)
+        self.latencia = latencia
+        self.jitter = jitter
+        self.requisicoes = 0
+        self.status_erro = None
+        self._lock = threading.Lock()
+
+    def contar(self):
+        with self._lock:
+            self.requisicoes += 1
+
+
+class ManipuladorStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.contar()
+        time.sleep(
+            max(self.server.latencia + random.uniform(-1, 1) * self.server.jitter, 0)
+        )
+
+        if self.server.status_erro:
+            dados = json.dumps({"error": {"message": "erro simulado"}}).encode()
+            self.send_response(self.server.status_erro)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+            return
+
+        prompt = corpo["messages"][-1]["content"]
+        conteudo = resposta_para(prompt)
+        dados = json.dumps(
+            {
+                "id": f"stub-{self.server.requisicoes}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": corpo.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": conteudo},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(conteudo) // 4,
+                    "total_tokens": (len(prompt) + len(conteudo)) // 4,
+                },
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_stub(porta=0, latencia=0.5, jitter=0.0) -> ServidorStub:
+    """Sobe o stub numa thread; `porta=0` escolhe uma porta livre"""
+    servidor = ServidorStub(("127.0.0.1", porta), latencia, jitter)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--porta", type=int, default=8089)
+    parser.add_argument("--latencia", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    servidor = ServidorStub(("127.0.0.1", args.porta), args.latencia, args.jitter)
+    print(f"Stub da IA em http://127.0.0.1:{args.porta}/v1")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
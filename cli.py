@@ -0,0 +1,120 @@
+"""Comandos de manutenção do Pjotinha
+
+Uso:
+    python cli.py aquecer-aulas
+    python cli.py indexar
+    python cli.py migrar
+    python cli.py exportar alunos|historico [--formato ndjson|csv] [--saida arquivo]
+    python cli.py analisar
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def aquecer_aulas(args):
+    from Main import warm_lesson_cache
+    from db import migrar_banco
+
+    migrar_banco()
+    total = warm_lesson_cache()
+    logger.info(f"{total} aulas disponíveis no cache")
+
+
+def indexar(args):
+    from Main import COURSE_BASE_PATH, PDF_MODULES_PATH, SEARCH_INDEX_PATH
+    from lib.retrieval import construir_indice
+
+    construir_indice(SEARCH_INDEX_PATH, PDF_MODULES_PATH, COURSE_BASE_PATH)
+
+
+def migrar(args):
+    from db import migrar_banco
+
+    versao = migrar_banco()
+    logger.info(f"Banco de dados na versão {versao} do schema")
+
+
+def exportar(args):
+    from Main import ANALYTICS_SOURCE, EXPORT_TABLES
+    from lib.analytics import exportar_tabela
+
+    # Snapshot novo: a exportação reflete o banco no momento do comando
+    blocos = exportar_tabela(
+        ANALYTICS_SOURCE.engine(atualizar=True),
+        EXPORT_TABLES[args.tabela],
+        args.formato,
+        lote=args.lote,
+        apos_id=args.apos_id,
+    )
+    saida = open(args.saida, "w", encoding="utf-8", newline="") if args.saida else None
+    try:
+        for bloco in blocos:
+            (saida or sys.stdout).write(bloco)
+    finally:
+        if saida:
+            saida.close()
+
+
+def analisar(args):
+    from Main import ANALYTICS_SOURCE, module_scores, stage_funnel
+
+    engine = ANALYTICS_SOURCE.engine(atualizar=True)
+    resultado = {"funil": stage_funnel(engine), "pontuacao": module_scores(engine)}
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comandos de manutenção do curso")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    aquecer = subparsers.add_parser(
+        "aquecer-aulas", help="Pré-gera e persiste as aulas de todos os módulos"
+    )
+    aquecer.set_defaults(func=aquecer_aulas)
+
+    indexar_parser = subparsers.add_parser(
+        "indexar", help="Reconstrói o índice de busca sobre os PDFs e a base modular"
+    )
+    indexar_parser.set_defaults(func=indexar)
+
+    migrar_parser = subparsers.add_parser(
+        "migrar", help="Aplica as migrações pendentes ao banco de dados"
+    )
+    migrar_parser.set_defaults(func=migrar)
+
+    exportar_parser = subparsers.add_parser(
+        "exportar",
+        help="Exporta alunos ou histórico em blocos, lendo da réplica ou de um snapshot",
+    )
+    exportar_parser.add_argument("tabela", choices=("alunos", "historico"))
+    exportar_parser.add_argument(
+        "--formato", choices=("ndjson", "csv"), default="ndjson"
+    )
+    exportar_parser.add_argument("--saida", help="arquivo de saída (padrão: stdout)")
+    exportar_parser.add_argument("--lote", type=int, default=1000)
+    exportar_parser.add_argument(
+        "--apos-id", type=int, default=0, help="apenas linhas com id maior"
+    )
+    exportar_parser.set_defaults(func=exportar)
+
+    analisar_parser = subparsers.add_parser(
+        "analisar", help="Funil de etapas e pontuação por módulo, em JSON"
+    )
+    analisar_parser.set_defaults(func=analisar)
+
+    args = parser.parse_args()
+    # Mensagens de log vão para stderr, sem misturar com exportações em stdout
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,31 @@
-from sqlalchemy import Column, Integer, String, JSON, create_engine
+import os
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    JSON,
+    String,
+    UniqueConstraint,
+    create_engine,
+    event,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite:///alunos.db"
+# Configuração do banco pelo ambiente; para Postgres basta trocar DATABASE_URL
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///alunos.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Ajustes do SQLite aplicados em cada conexão
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024)))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
 
 Base = declarative_base()
 
@@ -17,16 +40,140 @@ class Aluno(Base):
     etapa = Column(String)
     perfil = Column(JSON)
     pontuacao = Column(Integer, default=0)
+    resumo = Column(String)  # resumo acumulado da conversa
+    resumo_ate = Column(Integer, default=0)  # id da última mensagem do histórico no resumo
+
+def _configurar_sqlite(conexao, _registro):
+    cursor = conexao.cursor()
+    # WAL: leitores não bloqueiam o escritor e vice-versa
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def criar_engine(url=None):
+    """Cria a engine do banco configurada pelo ambiente"""
+    url = url or DATABASE_URL
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    opcoes = {
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+    }
+    if ":memory:" not in url and url not in ("sqlite://", "sqlite:///"):
+        opcoes.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    engine = create_engine(url, **opcoes)
+    event.listen(engine, "connect", _configurar_sqlite)
+    return engine
+
+engine = criar_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 class HistoricoConversa(Base):
     __tablename__ = "historico_conversas"
+    # Índice composto: as últimas mensagens do aluno saem lendo o índice de trás para frente
+    __table_args__ = (Index("ix_historico_aluno_timestamp", "aluno_id", "timestamp"),)
     id = Column(Integer, primary_key=True, index=True)
     aluno_id = Column(Integer)
     remetente = Column(String)  # 'aluno' ou 'IA'
     mensagem = Column(String)
-    timestamp = Column(String)
+    timestamp = Column(DateTime)
+
+class ConteudoAula(Base):
+    __tablename__ = "conteudos_aula"
+    __table_args__ = (UniqueConstraint("modulo", "parte", "pdf_hash"),)
+    id = Column(Integer, primary_key=True, index=True)
+    modulo = Column(String, index=True)
+    parte = Column(Integer)
+    pdf_hash = Column(String)  # sha256 do PDF de origem
+    conteudo = Column(String)
+    criado_em = Column(String)
+
+class QuestaoEmitida(Base):
+    __tablename__ = "questoes_emitidas"
+    __table_args__ = (UniqueConstraint("aluno_id", "etapa"),)
+    id = Column(Integer, primary_key=True, index=True)
+    aluno_id = Column(Integer)
+    etapa = Column(String)  # etapa de quiz em que a questão foi enviada
+    texto = Column(String)
+    resposta_correta = Column(String)
+    criado_em = Column(String)
+
+def _adicionar_coluna(tabela, coluna, tipo):
+    """Comando de migração que adiciona a coluna apenas se ela ainda não existir"""
+    def executar(conn):
+        colunas = {linha[1] for linha in conn.exec_driver_sql(f"PRAGMA table_info({tabela})")}
+        if coluna not in colunas:
+            conn.exec_driver_sql(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+    return executar
+
+# Migrações de bancos SQLite existentes, controladas por PRAGMA user_version.
+# Cada comando é SQL ou uma função que recebe a conexão
+MIGRACOES = [
+    (
+        1,
+        [
+            "CREATE INDEX IF NOT EXISTS ix_historico_aluno_timestamp "
+            "ON historico_conversas (aluno_id, timestamp)",
+            # Timestamps antigos em isoformat() ('T') para o formato do DateTime do SQLite
+            "UPDATE historico_conversas SET timestamp = replace(timestamp, 'T', ' ') "
+            "WHERE timestamp LIKE '%T%'",
+        ],
+    ),
+    (
+        2,
+        [
+            _adicionar_coluna("alunos", "resumo", "VARCHAR"),
+            _adicionar_coluna("alunos", "resumo_ate", "INTEGER DEFAULT 0"),
+        ],
+    ),
+]
+
+def migrar_banco():
+    """Cria as tabelas e aplica as migrações pendentes; retorna a versão final do schema
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    No SQLite, tudo roda em uma transação BEGIN IMMEDIATE: workers que iniciam
+    juntos esperam o primeiro terminar e releem user_version depois de obter a
+    trava, sem repetir nenhuma migração.
+    """
+    if engine.dialect.name != "sqlite":
+        Base.metadata.create_all(bind=engine)
+        return None
+    # Em AUTOCOMMIT o driver não abre transações sozinho: a transação é a do BEGIN
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            Base.metadata.create_all(bind=conn)
+            versao = conn.exec_driver_sql("PRAGMA user_version").scalar()
+            for numero, comandos in MIGRACOES:
+                if numero <= versao:
+                    continue
+                for comando in comandos:
+                    if callable(comando):
+                        comando(conn)
+                    else:
+                        conn.exec_driver_sql(comando)
+                conn.exec_driver_sql(f"PRAGMA user_version = {numero}")
+                versao = numero
+            conn.exec_driver_sql("COMMIT")
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+    return versao
@@ -0,0 +1,249 @@
+import csv
+import io
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+class FonteAnalitica:
+    """Banco somente leitura das análises, separado do banco que atende os webhooks
+
+    Com `url_replica`, as consultas vão para a réplica. Sem réplica e com o banco
+    principal em um arquivo SQLite, elas leem uma cópia (snapshot) refeita quando
+    tem mais de `validade` segundos; a cópia sai de uma única transação de leitura,
+    que no modo WAL não bloqueia as gravações. Em outros bancos sem réplica, as
+    consultas usam o próprio banco principal, onde leituras não bloqueiam escritas.
+    """
+
+    def __init__(
+        self,
+        engine_principal,
+        url_replica="",
+        caminho_snapshot="alunos_snapshot.db",
+        validade=300.0,
+    ):
+        self._principal = engine_principal
+        self._caminho_snapshot = caminho_snapshot
+        self._validade = validade
+        self._lock = threading.Lock()
+        self._engine = None
+        self._criado_em = 0.0
+        self.duracao_copia = 0.0
+        if url_replica:
+            self.modo = "replica"
+            self._engine = create_engine(url_replica, pool_pre_ping=True)
+        elif engine_principal.dialect.name == "sqlite" and _arquivo_sqlite(
+            engine_principal
+        ):
+            self.modo = "snapshot"
+        else:
+            self.modo = "principal"
+            self._engine = engine_principal
+
+    def engine(self, atualizar=False):
+        """Engine das consultas; refaz o snapshot se vencido ou se `atualizar`"""
+        if self.modo != "snapshot":
+            return self._engine
+        with self._lock:
+            vencido = time.monotonic() - self._criado_em > self._validade
+            if atualizar or self._engine is None or vencido:
+                self._atualizar_snapshot()
+            return self._engine
+
+    def _atualizar_snapshot(self):
+        inicio = time.perf_counter()
+        origem_uri = Path(_arquivo_sqlite(self._principal)).resolve().as_uri()
+        # Arquivo temporário único: outros processos podem estar refazendo a cópia
+        descritor, temporario = tempfile.mkstemp(
+            prefix=f"{Path(self._caminho_snapshot).name}.",
+            suffix=".tmp",
+            dir=Path(self._caminho_snapshot).resolve().parent,
+        )
+        os.close(descritor)
+        try:
+            origem = sqlite3.connect(f"{origem_uri}?mode=ro", uri=True, timeout=30)
+            destino = sqlite3.connect(temporario)
+            try:
+                origem.backup(destino)
+                # A cópia herda o modo WAL, que não abre sem escrita no diretório
+                destino.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                destino.close()
+                origem.close()
+        except BaseException:
+            os.unlink(temporario)
+            raise
+        # Exportações em andamento continuam lendo o arquivo anterior
+        os.replace(temporario, self._caminho_snapshot)
+
+        snapshot_uri = Path(self._caminho_snapshot).resolve().as_uri()
+        anterior = self._engine
+        self._engine = create_engine(
+            "sqlite://",
+            creator=lambda: sqlite3.connect(
+                f"{snapshot_uri}?mode=ro", uri=True, check_same_thread=False
+            ),
+            poolclass=NullPool,
+        )
+        if anterior is not None:
+            anterior.dispose()
+        self._criado_em = time.monotonic()
+        self.duracao_copia = time.perf_counter() - inicio
+        logger.info(f"Snapshot para análises criado em {self.duracao_copia:.2f} s")
+
+    def estatisticas(self) -> dict:
+        idade = time.monotonic() - self._criado_em if self._criado_em else None
+        return {
+            "modo": self.modo,
+            "idade_snapshot": idade,
+            "duracao_copia": self.duracao_copia,
+        }
+
+
+def _arquivo_sqlite(engine):
+    banco = engine.url.database
+    if not banco or banco == ":memory:" or banco.startswith("file:"):
+        return None
+    return banco
+
+
+def funil_etapas(engine, tabela, ordem, resolver=None) -> dict:
+    """Alunos em cada etapa e quantos chegaram até ela, na ordem do curso
+
+    `ordem` é a sequência de nomes de etapa do curso; `resolver` converte etapas
+    salvas que não estão em `ordem` (ou devolve None para contá-las à parte).
+    """
+    with engine.connect() as conexao:
+        linhas = conexao.execute(
+            select(tabela.c.etapa, func.count()).group_by(tabela.c.etapa)
+        ).all()
+
+    por_etapa = Counter()
+    desconhecidas = 0
+    for etapa, alunos in linhas:
+        if etapa not in ordem and resolver is not None:
+            etapa = resolver(etapa)
+        if etapa in ordem:
+            por_etapa[etapa] += alunos
+        else:
+            desconhecidas += alunos
+
+    # Quem está numa etapa já passou por todas as anteriores
+    etapas = []
+    alcancaram = sum(por_etapa.values())
+    anteriores = alcancaram
+    for etapa in ordem:
+        etapas.append(
+            {
+                "etapa": etapa,
+                "alunos": por_etapa[etapa],
+                "alcancaram": alcancaram,
+                "conversao": alcancaram / anteriores if anteriores else 0.0,
+            }
+        )
+        anteriores = alcancaram
+        alcancaram -= por_etapa[etapa]
+    return {
+        "total": sum(por_etapa.values()) + desconhecidas,
+        "desconhecidas": desconhecidas,
+        "etapas": etapas,
+    }
+
+
+def pontuacao_por_modulo(engine, tabela, modulo_da_etapa) -> dict:
+    """Distribuição da pontuação dos alunos agrupada pelo módulo em que estão
+
+    `modulo_da_etapa` converte a etapa salva no rótulo do módulo. A agregação por
+    etapa e pontuação é feita no banco; só os grupos chegam à aplicação.
+    """
+    with engine.connect() as conexao:
+        linhas = conexao.execute(
+            select(tabela.c.etapa, tabela.c.pontuacao, func.count()).group_by(
+                tabela.c.etapa, tabela.c.pontuacao
+            )
+        ).all()
+
+    distribuicoes = defaultdict(Counter)
+    for etapa, pontuacao, alunos in linhas:
+        distribuicoes[modulo_da_etapa(etapa)][pontuacao or 0] += alunos
+
+    resultado = {}
+    for modulo, distribuicao in sorted(distribuicoes.items()):
+        alunos = sum(distribuicao.values())
+        resultado[modulo] = {
+            "alunos": alunos,
+            "media": sum(p * n for p, n in distribuicao.items()) / alunos,
+            "minima": min(distribuicao),
+            "maxima": max(distribuicao),
+            "distribuicao": {str(p): n for p, n in sorted(distribuicao.items())},
+        }
+    return resultado
+
+
+def exportar_tabela(engine, tabela, formato="ndjson", lote=1000, apos_id=0):
+    """Gera o conteúdo da tabela em blocos de texto de até `lote` linhas
+
+    As linhas são lidas em ordem de id com cursor no servidor (stream_results),
+    então a memória usada não depende do tamanho da tabela. Com `apos_id`, só
+    linhas de id maior, para exportações incrementais.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    colunas = [coluna.name for coluna in tabela.columns]
+    consulta = select(tabela).order_by(tabela.c.id)
+    if apos_id:
+        consulta = consulta.where(tabela.c.id > apos_id)
+
+    with engine.connect() as conexao:
+        resultado = conexao.execution_options(
+            stream_results=True, yield_per=lote
+        ).execute(consulta)
+        if formato == "csv":
+            yield _linhas_csv([colunas])
+        for linhas in resultado.partitions():
+            if formato == "csv":
+                yield _linhas_csv(
+                    [[_valor_csv(valor) for valor in linha] for linha in linhas]
+                )
+            else:
+                yield "".join(
+                    json.dumps(
+                        dict(zip(colunas, linha)),
+                        ensure_ascii=False,
+                        default=_serializar,
+                    )
+                    + "\n"
+                    for linha in linhas
+                )
+
+
+def _linhas_csv(linhas):
+    saida = io.StringIO()
+    csv.writer(saida).writerows(linhas)
+    return saida.getvalue()
+
+
+def _valor_csv(valor):
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False)
+    return _serializar(valor) if isinstance(valor, (date, datetime)) else valor
+
+
+def _serializar(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
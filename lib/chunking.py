@@ -0,0 +1,76 @@
+import re
+from collections import namedtuple
+
+Trecho = namedtuple("Trecho", "indice inicio fim texto")
+
+# Fim de linha que encerra uma frase (provável fim de parágrafo no texto do PDF)
+_FIM_PARAGRAFO = re.compile(r"(?<=[.!?:])[ \t]*\n")
+
+# Hifenização do PDF ("empreen\xad\ndedor") e quebras de linha dentro do parágrafo
+_HIFEN = re.compile(r"\xad\s*\n?")
+_ESPACOS = re.compile(r"\s+")
+
+
+def limpar_texto(texto: str) -> str:
+    """Remove hifenização e quebras de linha do texto extraído do PDF"""
+    return _ESPACOS.sub(" ", _HIFEN.sub("", texto)).strip()
+
+
+def _paragrafos(texto):
+    inicio = 0
+    for fim_linha in _FIM_PARAGRAFO.finditer(texto):
+        yield inicio, fim_linha.start()
+        inicio = fim_linha.end()
+    if inicio < len(texto):
+        yield inicio, len(texto)
+
+
+def dividir_em_trechos(texto: str, tamanho_maximo: int = 1200):
+    """Divide o texto em trechos de parágrafos inteiros, com offsets no texto original
+
+    O cache de texto dos módulos (lib.text_cache) guarda o resultado junto com o
+    texto, dentro do mesmo limite de memória, e divide cada PDF uma única vez.
+    """
+    trechos = []
+    inicio_trecho = fim_trecho = None
+    for inicio, fim in _paragrafos(texto):
+        if inicio_trecho is None:
+            inicio_trecho = inicio
+        elif fim - inicio_trecho > tamanho_maximo:
+            trechos.append(
+                _criar_trecho(texto, len(trechos), inicio_trecho, fim_trecho)
+            )
+            inicio_trecho = inicio
+        fim_trecho = fim
+    if inicio_trecho is not None:
+        trechos.append(_criar_trecho(texto, len(trechos), inicio_trecho, fim_trecho))
+    return tuple(trecho for trecho in trechos if trecho.texto)
+
+
+def _criar_trecho(texto, indice, inicio, fim):
+    return Trecho(indice, inicio, fim, limpar_texto(texto[inicio:fim]))
+
+
+def trechos_da_parte(trechos, parte: int, total_partes: int):
+    """Retorna a faixa contígua de trechos que cabe à parte (1-based) do módulo"""
+    if not trechos or total_partes < 1:
+        return ()
+    parte = min(max(parte, 1), total_partes)
+    inicio = (parte - 1) * len(trechos) // total_partes
+    fim = max(parte * len(trechos) // total_partes, inicio + 1)
+    return trechos[inicio:fim]
+
+
+def texto_da_parte(trechos, parte: int, total_partes: int, limite: int = 4000) -> str:
+    """Texto limpo da parte do módulo, limitado a `limite` caracteres
+
+    `trechos` é o resultado de `dividir_em_trechos` para o texto do módulo.
+    """
+    selecionados = []
+    tamanho = 0
+    for trecho in trechos_da_parte(trechos, parte, total_partes):
+        if selecionados and tamanho + len(trecho.texto) > limite:
+            break
+        selecionados.append(trecho.texto)
+        tamanho += len(trecho.texto) + 1
+    return "\n".join(selecionados)[:limite]
@@ -0,0 +1,111 @@
+"""Contexto das conversas com a IA dentro de um orçamento fixo de tokens
+
+Cada aluno tem um resumo da conversa guardado junto com o seu registro e uma
+janela das mensagens mais recentes ainda não resumidas. `montar_mensagens`
+combina prompt do sistema, resumo, trechos do curso e essa janela sem passar do
+orçamento; `mensagens_resumo` monta o pedido que incorpora mensagens antigas ao
+resumo. Os tokens são estimados pelo número de caracteres, o que basta para
+manter o prompt limitado sem depender do tokenizador de cada modelo.
+"""
+
+# Média de caracteres por token em textos em português nos tokenizadores BPE
+CARACTERES_POR_TOKEN = 3.5
+
+# Tokens extras que a API conta para cada mensagem (papel e separadores)
+TOKENS_POR_MENSAGEM = 4
+
+INSTRUCOES_RESUMO = (
+    "Você mantém o resumo da conversa entre o Pjotinha, tutor do curso 'Meu "
+    "Primeiro CNPJ', e um aluno. Atualize o resumo com as mensagens novas, em "
+    "português e em no máximo 5 frases: o que o aluno já estudou, suas dúvidas, "
+    "dificuldades e objetivos. Responda apenas com o resumo atualizado."
+)
+
+
+def estimar_tokens(texto: str) -> int:
+    """Número aproximado de tokens do texto"""
+    return int(len(texto) / CARACTERES_POR_TOKEN) + 1 if texto else 0
+
+
+def truncar(texto: str, max_tokens: int) -> str:
+    """Corta o texto no último espaço para que tenha no máximo `max_tokens` tokens"""
+    if estimar_tokens(texto) <= max_tokens:
+        return texto
+    if max_tokens < 1:
+        return ""
+    # Reticências incluídas, o texto cortado fica abaixo de max_tokens estimados
+    limite = max(int((max_tokens - 1) * CARACTERES_POR_TOKEN) - 1, 0)
+    cortado = texto[:limite]
+    if " " in cortado:
+        cortado = cortado.rsplit(" ", 1)[0]
+    return cortado.rstrip() + "…"
+
+
+def _secao(titulo, texto, max_tokens):
+    """Título e texto truncado juntos em no máximo `max_tokens` (vazio se não couber)"""
+    texto = truncar(texto, max_tokens - estimar_tokens(titulo))
+    return titulo + texto if texto else ""
+
+
+def montar_mensagens(sistema, mensagem, historico, orcamento, resumo="", trechos=""):
+    """Mensagens para a IA com no máximo `orcamento` tokens estimados
+
+    `historico` é uma lista de pares (papel, texto), da mensagem mais antiga para
+    a mais recente. O prompt do sistema (até metade do orçamento) e a mensagem
+    atual (até um quarto) sempre entram, truncados se preciso; depois o resumo,
+    os trechos do curso (cada um com até metade do que sobrar) e, por fim, as
+    mensagens mais recentes do histórico que ainda couberem. A estimativa de um
+    texto nunca passa da soma das estimativas das partes, então contar as partes
+    garante o limite do total.
+    """
+    sistema = truncar(sistema, orcamento // 2)
+    mensagem = truncar(mensagem, orcamento // 4)
+    restante = (
+        orcamento
+        - estimar_tokens(sistema)
+        - estimar_tokens(mensagem)
+        - 2 * TOKENS_POR_MENSAGEM
+    )
+
+    for titulo, texto in (
+        ("\n\nResumo da conversa até aqui:\n", resumo),
+        ("\n\nUse o material do curso abaixo quando for relevante:\n", trechos),
+    ):
+        secao = _secao(titulo, texto, restante // 2) if texto else ""
+        sistema += secao
+        restante -= estimar_tokens(secao)
+
+    janela = []
+    for papel, texto in reversed(historico):
+        custo = estimar_tokens(texto) + TOKENS_POR_MENSAGEM
+        if custo > restante:
+            break
+        janela.append({"role": papel, "content": texto})
+        restante -= custo
+    janela.reverse()
+
+    return (
+        [{"role": "system", "content": sistema}]
+        + janela
+        + [{"role": "user", "content": mensagem}]
+    )
+
+
+def mensagens_resumo(resumo, historico, max_tokens_mensagem=150):
+    """Pedido à IA que incorpora as mensagens de `historico` ao resumo atual
+
+    Mensagens longas, como as aulas enviadas ao aluno, entram truncadas.
+    """
+    linhas = [
+        f"{'Aluno' if papel == 'user' else 'Pjotinha'}: "
+        + truncar(" ".join(texto.split()), max_tokens_mensagem)
+        for papel, texto in historico
+    ]
+    conteudo = (
+        f"Resumo atual:\n{resumo or '(vazio)'}\n\nMensagens novas:\n"
+        + "\n".join(linhas)
+    )
+    return [
+        {"role": "system", "content": INSTRUCOES_RESUMO},
+        {"role": "user", "content": conteudo},
+    ]
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from db import ConteudoAula, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Hash dos PDFs memorizado por (mtime, tamanho) para não reler o arquivo a cada aula
+_HASHES_PDF = {}
+
+# Um lock por chave (modulo, parte, hash) garante uma única geração simultânea
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def hash_pdf(caminho_pdf: str) -> str:
+    """Calcula o sha256 de um PDF, reaproveitando o valor enquanto o arquivo não muda"""
+    stat = os.stat(caminho_pdf)
+    assinatura = (stat.st_mtime_ns, stat.st_size)
+    memorizado = _HASHES_PDF.get(caminho_pdf)
+    if memorizado and memorizado[0] == assinatura:
+        return memorizado[1]
+
+    sha = hashlib.sha256()
+    with open(caminho_pdf, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 16), b""):
+            sha.update(bloco)
+    digest = sha.hexdigest()
+    _HASHES_PDF[caminho_pdf] = (assinatura, digest)
+    return digest
+
+
+def _chave_pdf(caminho_pdf, versao=None):
+    pdf_hash = hash_pdf(caminho_pdf)
+    return f"{pdf_hash}:{versao}" if versao else pdf_hash
+
+
+def _lock_para(chave):
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(chave, threading.Lock())
+
+
+def buscar_aula(modulo: str, parte: int, pdf_hash: str):
+    """Retorna o conteúdo persistido da aula ou None se ainda não foi gerado"""
+    with SessionLocal() as session:
+        registro = (
+            session.query(ConteudoAula.conteudo)
+            .filter_by(modulo=str(modulo), parte=parte, pdf_hash=pdf_hash)
+            .first()
+        )
+        return registro[0] if registro else None
+
+
+def aula_persistida(modulo: str, parte: int, caminho_pdf: str, versao=None) -> bool:
+    """Indica se a aula da versão atual do PDF (e do prompt) já está persistida"""
+    return buscar_aula(modulo, parte, _chave_pdf(caminho_pdf, versao)) is not None
+
+
+def salvar_aula(modulo: str, parte: int, pdf_hash: str, conteudo: str) -> bool:
+    """Persiste o conteúdo da aula e descarta versões geradas a partir de PDFs antigos"""
+    with SessionLocal() as session:
+        try:
+            session.query(ConteudoAula).filter(
+                ConteudoAula.modulo == str(modulo),
+                ConteudoAula.parte == parte,
+                ConteudoAula.pdf_hash != pdf_hash,
+            ).delete(synchronize_session=False)
+            session.add(
+                ConteudoAula(
+                    modulo=str(modulo),
+                    parte=parte,
+                    pdf_hash=pdf_hash,
+                    conteudo=conteudo,
+                    criado_em=datetime.now().isoformat(),
+                )
+            )
+            session.commit()
+            return True
+        except IntegrityError:
+            # Outro processo salvou a mesma aula primeiro
+            session.rollback()
+            return False
+        except SQLAlchemyError as e:
+            logger.error(f"Erro ao salvar conteúdo da aula: {e}")
+            session.rollback()
+            return False
+
+
+def obter_aula(modulo: str, parte: int, caminho_pdf: str, gerar, versao=None) -> str:
+    """Busca a aula no cache persistido ou gera uma única vez com `gerar()`
+
+    `gerar` pode lançar exceção; nesse caso nada é salvo e a exceção é propagada.
+    `versao` identifica o prompt usado e entra na chave junto com o hash do PDF.
+    """
+    pdf_hash = _chave_pdf(caminho_pdf, versao)
+    conteudo = buscar_aula(modulo, parte, pdf_hash)
+    if conteudo is not None:
+        return conteudo
+
+    with _lock_para((str(modulo), parte, pdf_hash)):
+        # Outra requisição pode ter gerado a aula enquanto esperávamos o lock
+        conteudo = buscar_aula(modulo, parte, pdf_hash)
+        if conteudo is not None:
+            return conteudo
+
+        logger.info(f"Gerando aula do módulo {modulo}, parte {parte}")
+        conteudo = gerar()
+        salvar_aula(modulo, parte, pdf_hash, conteudo)
+        return conteudo
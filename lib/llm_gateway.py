@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+_ESPACOS = re.compile(r"\s+")
+
+
+def normalizar_prompt(texto: str) -> str:
+    """Forma canônica do texto usada na chave do cache
+
+    Ignora maiúsculas, espaços repetidos e pontuação final, para que perguntas
+    como "O que é MEI?" e "o que é mei" reaproveitem a mesma resposta.
+    """
+    return _ESPACOS.sub(" ", texto).strip().lower().rstrip("?!. ")
+
+
+def chave_prompt(parametros: dict) -> str:
+    """Chave do cache: modelo, parâmetros de geração e mensagens normalizadas"""
+    mensagens = [
+        (mensagem.get("role"), normalizar_prompt(str(mensagem.get("content", ""))))
+        for mensagem in parametros.get("messages", [])
+    ]
+    demais = {
+        chave: valor for chave, valor in parametros.items() if chave != "messages"
+    }
+    serializado = json.dumps([demais, mensagens], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+class _Chamada:
+    """Chamada em andamento; as requisições idênticas esperam o mesmo resultado"""
+
+    __slots__ = ("concluida", "resposta", "erro")
+
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resposta = None
+        self.erro = None
+
+
+class GatewayIA:
+    """Ponto único de acesso à IA com cache, coalescência e limite de concorrência
+
+    Respostas ficam em um cache LRU com validade de `ttl` segundos, indexado pelo
+    prompt normalizado. Chamadas idênticas simultâneas aguardam a primeira em vez
+    de irem à API, e no máximo `max_concorrencia` chamadas ficam em andamento.
+    Se `histograma` for informado, a latência de cada chamada à API é observada.
+    Com um backend `compartilhado` (ver lib.shared_cache), as respostas também
+    ficam disponíveis para os outros processos e um prompt idêntico não é enviado
+    à API por mais de um processo ao mesmo tempo.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_concorrencia=8,
+        timeout=20.0,
+        ttl=3600.0,
+        capacidade=1000,
+        histograma=None,
+        compartilhado=None,
+    ):
+        self._client = client
+        self._histograma = histograma
+        self._compartilhado = compartilhado
+        self._timeout = timeout
+        self._ttl = ttl
+        self._capacidade = capacidade
+        self._semaforo = threading.BoundedSemaphore(max_concorrencia)
+        self._cache = OrderedDict()  # chave -> (expira_em, resposta)
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+
+        self.chamadas = 0
+        self.hits = 0
+        self.coalescidas = 0
+        self.erros = 0
+        self.tokens_prompt = 0
+        self.tokens_resposta = 0
+        self._latencias = deque(maxlen=1000)
+
+    def completar(self, usar_cache=True, **parametros):
+        """Equivalente a `client.chat.completions.create(**parametros)`"""
+        if not usar_cache:
+            return self._chamar(parametros)
+
+        chave = chave_prompt(parametros)
+        with self._lock:
+            resposta = self._buscar(chave)
+            if resposta is not None:
+                self.hits += 1
+                return resposta
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = _Chamada()
+            else:
+                self.coalescidas += 1
+
+        if not lider:
+            if not chamada.concluida.wait(self._timeout):
+                raise TimeoutError("Tempo esgotado aguardando chamada idêntica à IA")
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resposta
+
+        try:
+            if self._compartilhado is None:
+                chamada.resposta = self._chamar(parametros)
+            else:
+                chamada.resposta = self._chamar_compartilhado(chave, parametros)
+            with self._lock:
+                self._guardar(chave, chamada.resposta)
+            return chamada.resposta
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            chamada.concluida.set()
+
+    def _chamar_compartilhado(self, chave, parametros):
+        chave_compartilhada = f"ia:{chave}"
+        with self._compartilhado.travar(chave_compartilhada):
+            serializada = self._compartilhado.obter(chave_compartilhada)
+            if serializada is not None:
+                with self._lock:
+                    self.hits += 1
+                return ChatCompletion.model_validate_json(serializada)
+            resposta = self._chamar(parametros)
+            if isinstance(resposta, ChatCompletion):
+                self._compartilhado.gravar(
+                    chave_compartilhada, resposta.model_dump_json(), ttl=self._ttl
+                )
+            return resposta
+
+    def _buscar(self, chave):
+        item = self._cache.get(chave)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._cache[chave]
+            return None
+        self._cache.move_to_end(chave)
+        return item[1]
+
+    def _guardar(self, chave, resposta):
+        self._cache[chave] = (time.monotonic() + self._ttl, resposta)
+        self._cache.move_to_end(chave)
+        while len(self._cache) > self._capacidade:
+            self._cache.popitem(last=False)
+
+    def _chamar(self, parametros):
+        if not self._semaforo.acquire(timeout=self._timeout):
+            raise TimeoutError("Limite de chamadas simultâneas à IA atingido")
+        inicio = time.perf_counter()
+        try:
+            resposta = self._client.chat.completions.create(**parametros)
+        except Exception:
+            with self._lock:
+                self.erros += 1
+            raise
+        finally:
+            self._semaforo.release()
+
+        latencia = time.perf_counter() - inicio
+        if self._histograma is not None:
+            self._histograma.observar(latencia, modelo=parametros.get("model", ""))
+        uso = getattr(resposta, "usage", None)
+        with self._lock:
+            self.chamadas += 1
+            self._latencias.append(latencia)
+            self.tokens_prompt += getattr(uso, "prompt_tokens", 0) or 0
+            self.tokens_resposta += getattr(uso, "completion_tokens", 0) or 0
+        logger.info(
+            f"Chamada à IA ({parametros.get('model')}) em {latencia * 1000:.0f} ms"
+        )
+        return resposta
+
+    def limpar(self):
+        with self._lock:
+            self._cache.clear()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            latencias = sorted(self._latencias)
+            atendidas = self.chamadas + self.hits + self.coalescidas
+            return {
+                "chamadas": self.chamadas,
+                "hits": self.hits,
+                "coalescidas": self.coalescidas,
+                "erros": self.erros,
+                "hit_ratio": (
+                    (self.hits + self.coalescidas) / atendidas if atendidas else 0.0
+                ),
+                "em_cache": len(self._cache),
+                "em_andamento": len(self._em_andamento),
+                "tokens_prompt": self.tokens_prompt,
+                "tokens_resposta": self.tokens_resposta,
+                "latencia_p50": _percentil(latencias, 0.50),
+                "latencia_p95": _percentil(latencias, 0.95),
+                "latencia_maxima": latencias[-1] if latencias else 0.0,
+            }
+
+
+def _percentil(valores_ordenados, fracao):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(int(len(valores_ordenados) * fracao), len(valores_ordenados) - 1)
+    return valores_ordenados[indice]
@@ -0,0 +1,278 @@
+import bisect
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) dos buckets dos histogramas de latência
+LIMITES_PADRAO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, valores):
+        return tuple(str(valores[rotulo]) for rotulo in self.rotulos)
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        linhas.extend(self._amostras())
+        return linhas
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores = collections.defaultdict(float)
+
+    def incrementar(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] += valor
+
+    def _amostras(self):
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {valor}"
+            for chave, valor in itens
+        ]
+
+
+class Medidor(_Metrica):
+    """Valor instantâneo; com `funcao`, o valor é lido no momento da coleta
+
+    `funcao` devolve um número ou, com rótulos, um dicionário {valores: número}.
+    """
+
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, rotulos=(), funcao=None):
+        super().__init__(nome, ajuda, rotulos)
+        self._funcao = funcao
+        self._valores = collections.defaultdict(float)
+
+    def somar(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] += valor
+
+    @contextmanager
+    def em_andamento(self, **rotulos):
+        self.somar(1, **rotulos)
+        try:
+            yield
+        finally:
+            self.somar(-1, **rotulos)
+
+    def _amostras(self):
+        if self._funcao is not None:
+            valores = self._funcao()
+            if not isinstance(valores, dict):
+                valores = {(): valores}
+            itens = sorted(
+                (chave if isinstance(chave, tuple) else (chave,), valor)
+                for chave, valor in valores.items()
+            )
+        else:
+            with self._lock:
+                itens = sorted(self._valores.items())
+        return [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {valor}"
+            for chave, valor in itens
+        ]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+        self._series = {}  # chave -> [contagens por bucket..., soma, total]
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        posicao = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [0] * (len(self.limites) + 1) + [0.0]
+            serie[posicao] += 1
+            serie[-1] += valor
+
+    @contextmanager
+    def medir(self, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def _amostras(self):
+        with self._lock:
+            series = sorted(
+                (chave, list(serie)) for chave, serie in self._series.items()
+            )
+        linhas = []
+        for chave, serie in series:
+            acumulado = 0
+            for limite, contagem in zip(self.limites + ("+Inf",), serie[:-1]):
+                acumulado += contagem
+                rotulos = _formatar_rotulos(self.rotulos, chave, ("le", limite))
+                linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, chave)
+            linhas.append(f"{self.nome}_sum{rotulos} {serie[-1]}")
+            linhas.append(f"{self.nome}_count{rotulos} {acumulado}")
+        return linhas
+
+
+class Registro:
+    """Conjunto de métricas exportado no formato de texto do Prometheus"""
+
+    def __init__(self):
+        self._metricas = []
+
+    def _registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome, ajuda, rotulos=(), funcao=None):
+        return self._registrar(Medidor(nome, ajuda, rotulos, funcao))
+
+    def histograma(self, nome, ajuda, rotulos=(), limites=LIMITES_PADRAO):
+        return self._registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            try:
+                linhas.extend(metrica.exportar())
+            except Exception as e:
+                logger.error(f"Erro ao coletar métrica {metrica.nome}: {e}")
+        return "\n".join(linhas) + "\n"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mede duração e requisições em andamento por rota
+
+    Caminhos fora de `rotas` são agrupados no rótulo "outra", para que URLs
+    arbitrárias não criem séries novas.
+    """
+
+    def __init__(self, app, histograma, em_andamento, rotas=()):
+        self.app = app
+        self._histograma = histograma
+        self._em_andamento = em_andamento
+        self._rotas = frozenset(rotas)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rota = scope["path"] if scope["path"] in self._rotas else "outra"
+        with self._em_andamento.em_andamento(rota=rota):
+            with self._histograma.medir(rota=rota):
+                await self.app(scope, receive, send)
+
+
+class AmostradorLento:
+    """Perfilador por amostragem para requisições lentas (opcional)
+
+    Enquanto uma requisição observada está em andamento, uma thread amostra a
+    pilha da thread que a executa a cada `intervalo` segundos; sem requisições
+    observadas, essa thread fica bloqueada e não consome CPU. Se a requisição
+    passar de `limite` segundos, as pilhas mais frequentes vão para o log; caso
+    contrário as amostras são descartadas.
+    """
+
+    def __init__(self, limite, intervalo=0.005, max_pilhas=5):
+        self._limite = limite
+        self._intervalo = intervalo
+        self._max_pilhas = max_pilhas
+        self._observadas = {}  # id da thread -> Counter de pilhas
+        self._lock = threading.Lock()
+        self._ha_observadas = threading.Condition(self._lock)
+        self._thread = None
+
+    @contextmanager
+    def observar(self, descricao):
+        thread_id = threading.get_ident()
+        amostras = collections.Counter()
+        with self._lock:
+            self._observadas[thread_id] = amostras
+            self._ha_observadas.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._amostrar, name="amostrador-lento", daemon=True
+                )
+                self._thread.start()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracao = time.perf_counter() - inicio
+            with self._lock:
+                del self._observadas[thread_id]
+            if duracao >= self._limite and amostras:
+                self._registrar(descricao, duracao, amostras)
+
+    def _amostrar(self):
+        while True:
+            # Espera sem acordar periodicamente até haver requisição observada
+            with self._ha_observadas:
+                self._ha_observadas.wait_for(lambda: self._observadas)
+            time.sleep(self._intervalo)
+            with self._lock:
+                observadas = list(self._observadas.items())
+            if not observadas:
+                continue
+            quadros = sys._current_frames()
+            for thread_id, amostras in observadas:
+                quadro = quadros.get(thread_id)
+                if quadro is not None:
+                    pilha = tuple(
+                        f"{resumo.filename.rsplit('/', 1)[-1]}:{resumo.lineno} {resumo.name}"
+                        for resumo in traceback.extract_stack(quadro)
+                    )
+                    amostras[pilha] += 1
+
+    def _registrar(self, descricao, duracao, amostras):
+        total = sum(amostras.values())
+        partes = [
+            f"Requisição lenta ({descricao}) em {duracao * 1000:.0f} ms, {total} amostras"
+        ]
+        for pilha, contagem in amostras.most_common(self._max_pilhas):
+            partes.append(
+                f"  {contagem / total:.0%} " + " <- ".join(reversed(pilha[-8:]))
+            )
+        logger.warning("\n".join(partes))
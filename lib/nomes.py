@@ -0,0 +1,152 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+# Lista de primeiros nomes distribuída com o projeto
+CAMINHO_NOMES = os.path.join(os.path.dirname(__file__), "primeiros_nomes.txt")
+
+_PALAVRA = re.compile(r"[^\W\d_]+(?:['-][^\W\d_]+)*")
+
+# Saudações e expressões que costumam abrir a resposta, já normalizadas
+SAUDACOES = (
+    ("bom", "dia"),
+    ("boa", "tarde"),
+    ("boa", "noite"),
+    ("tudo", "bem"),
+    ("tudo", "bom"),
+    ("tudo", "certo"),
+    ("e", "ai"),
+    ("oi",),
+    ("oie",),
+    ("oii",),
+    ("ola",),
+    ("opa",),
+    ("eai",),
+    ("salve",),
+    ("hey",),
+    ("hello",),
+    ("pjotinha",),
+    ("prazer",),
+)
+
+# Prefixos de apresentação; o que vem depois deles é o nome
+PREFIXOS = (
+    ("pode", "me", "chamar", "de"),
+    ("o", "meu", "nome", "e"),
+    ("o", "nome", "e"),
+    ("meu", "nome", "e"),
+    ("meu", "nome", "eh"),
+    ("eu", "me", "chamo"),
+    ("me", "chamam", "de"),
+    ("me", "chama", "de"),
+    ("aqui", "e", "o"),
+    ("aqui", "e", "a"),
+    ("eu", "sou", "o"),
+    ("eu", "sou", "a"),
+    ("meu", "nome"),
+    ("me", "chamo"),
+    ("aqui", "e"),
+    ("eu", "sou"),
+    ("sou", "o"),
+    ("sou", "a"),
+    ("sou",),
+    ("nome",),
+)
+
+# Prefixos que só antecedem um nome; depois dos demais ("sou", "eu sou"...) pode
+# vir qualquer coisa ("sou casado"), então o nome precisa estar na lista
+PREFIXOS_EXPLICITOS = frozenset(
+    [
+        ("pode", "me", "chamar", "de"),
+        ("o", "meu", "nome", "e"),
+        ("o", "nome", "e"),
+        ("meu", "nome", "e"),
+        ("meu", "nome", "eh"),
+        ("eu", "me", "chamo"),
+        ("me", "chamam", "de"),
+        ("me", "chama", "de"),
+        ("meu", "nome"),
+        ("me", "chamo"),
+    ]
+)
+
+# Palavras que aparecem depois dos prefixos mas não são nomes
+NAO_NOMES = frozenset(
+    """a aluna aluno aqui bem de do da e eh empreendedor empreendedora estou
+    estudante eu gostaria meu minha nao nome o obrigada obrigado ok quero sim
+    tudo um uma voce""".split()
+)
+
+
+def normalizar(texto: str) -> str:
+    """Texto minúsculo e sem acentos, usado nas comparações"""
+    decomposto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=4)
+def carregar_nomes(caminho: str = CAMINHO_NOMES) -> frozenset:
+    """Conjunto normalizado dos primeiros nomes do arquivo (vazio se ausente)"""
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            return frozenset(
+                normalizar(linha.strip())
+                for linha in arquivo
+                if linha.strip() and not linha.startswith("#")
+            )
+    except OSError:
+        return frozenset()
+
+
+def _remover_inicio(termos, sequencias):
+    """Primeira sequência que casa com o início de `termos` (vazia se nenhuma)"""
+    for sequencia in sequencias:
+        if tuple(termos[: len(sequencia)]) == sequencia:
+            return sequencia
+    return ()
+
+
+def _capitalizar(nome: str) -> str:
+    return "-".join(parte.capitalize() for parte in nome.split("-"))
+
+
+def extrair_nome(texto: str, nomes=None):
+    """Extrai o primeiro nome de uma resposta curta sem chamar a IA
+
+    Remove saudações e prefixos de apresentação ("meu nome é", "sou", "eu me
+    chamo"...) e confere o que sobra com a lista de primeiros nomes. Um nome fora
+    da lista só é aceito depois de um prefixo explícito ("meu nome é", "me chamo",
+    "pode me chamar de"). Retorna None quando o texto é ambíguo e a extração deve
+    ficar com a IA.
+    """
+    if nomes is None:
+        nomes = carregar_nomes()
+
+    palavras = _PALAVRA.findall(texto)
+    termos = [normalizar(palavra) for palavra in palavras]
+
+    # Saudações podem vir antes e depois da apresentação ("oi, tudo bem? sou a Ana")
+    inicio = 0
+    prefixo = ()
+    while inicio < len(termos):
+        removidos = _remover_inicio(termos[inicio:], SAUDACOES)
+        if not removidos and not prefixo:
+            removidos = prefixo = _remover_inicio(termos[inicio:], PREFIXOS)
+        if not removidos:
+            break
+        inicio += len(removidos)
+
+    restantes = palavras[inicio:]
+    if not restantes:
+        return None
+    candidato, termo = restantes[0], termos[inicio]
+    if len(termo) < 2 or termo in NAO_NOMES:
+        return None
+
+    conhecido = termo in nomes or all(parte in nomes for parte in termo.split("-"))
+    if conhecido or prefixo in PREFIXOS_EXPLICITOS:
+        return _capitalizar(candidato)
+    # O WhatsApp põe maiúscula na primeira letra de quase toda resposta, então
+    # "Legal" ou "Administração" sozinhos não indicam um nome: a IA decide
+    return None
@@ -0,0 +1,169 @@
+import base64
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class EnvioTwilio:
+    """Envia respostas pelo WhatsApp usando a API REST de mensagens da Twilio"""
+
+    URL = "https://api.twilio.com/2010-04-01/Accounts/{conta}/Messages.json"
+
+    def __init__(self, conta, token, remetente, timeout=10.0, tentativas=3):
+        self._url = self.URL.format(conta=conta)
+        credenciais = base64.b64encode(f"{conta}:{token}".encode()).decode()
+        self._autorizacao = f"Basic {credenciais}"
+        self._remetente = remetente
+        self._timeout = timeout
+        self._tentativas = tentativas
+
+    def enviar(self, destino: str, texto: str) -> bool:
+        dados = urllib.parse.urlencode(
+            {"From": self._remetente, "To": destino, "Body": texto}
+        ).encode()
+        for tentativa in range(1, self._tentativas + 1):
+            requisicao = urllib.request.Request(
+                self._url, data=dados, headers={"Authorization": self._autorizacao}
+            )
+            try:
+                with urllib.request.urlopen(requisicao, timeout=self._timeout):
+                    return True
+            except urllib.error.HTTPError as e:
+                logger.error(
+                    f"Erro {e.code} ao enviar resposta (tentativa {tentativa})"
+                )
+                if e.code < 500 and e.code != 429:
+                    # Erros do cliente não melhoram com nova tentativa
+                    return False
+            except OSError as e:
+                logger.error(f"Erro ao enviar resposta (tentativa {tentativa}): {e}")
+            time.sleep(0.5 * tentativa)
+        return False
+
+
+class EnvioFalso:
+    """Guarda as respostas em memória em vez de enviá-las (testes e benchmarks)"""
+
+    def __init__(self):
+        self.enviadas = []
+        self._lock = threading.Lock()
+
+    def enviar(self, destino: str, texto: str) -> bool:
+        with self._lock:
+            self.enviadas.append((destino, texto))
+        return True
+
+
+class Deduplicador:
+    """Lembra os identificadores vistos para descartar reenvios
+
+    Os identificadores ficam em um backend de lib.shared_cache; com o backend em
+    disco, um reenvio entregue a outro processo também é descartado.
+    """
+
+    def __init__(self, backend, validade=24 * 3600):
+        self._backend = backend
+        self._validade = validade
+        self.duplicadas = 0
+
+    def novo(self, identificador) -> bool:
+        """Registra o identificador; False se ele já tinha sido visto"""
+        if not identificador:
+            return True
+        if self._backend.adicionar(f"mensagem:{identificador}", "", self._validade):
+            return True
+        self.duplicadas += 1
+        return False
+
+
+class Prazo:
+    """Decide uma única vez se um turno síncrono é gravado ou abandonado
+
+    O webhook desiste com `expirar()` e o processamento só grava o aluno depois
+    de `confirmar()`. Vale a primeira chamada: um turno abandonado nunca altera o
+    aluno e um turno confirmado sempre tem a resposta entregue.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decisao = None
+
+    def _decidir(self, decisao) -> bool:
+        with self._lock:
+            if self._decisao is None:
+                self._decisao = decisao
+            return self._decisao == decisao
+
+    def confirmar(self) -> bool:
+        """True se o turno pode gravar; False se o webhook já desistiu"""
+        return self._decidir("confirmado")
+
+    def expirar(self) -> bool:
+        """True se o turno foi abandonado; False se ele já está gravando"""
+        return self._decidir("expirado")
+
+
+class FilaPorAluno:
+    """Executa tarefas no pool mantendo a ordem de chegada de cada aluno
+
+    Tarefas de alunos diferentes rodam em paralelo; as de um mesmo aluno rodam
+    uma de cada vez, na ordem em que foram enfileiradas.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._pendentes = {}  # chave -> deque de tarefas
+        self._lock = threading.Lock()
+        self._ociosa = threading.Condition(self._lock)
+        self.enfileiradas = 0
+        self.concluidas = 0
+
+    def enfileirar(self, chave, funcao, *args):
+        with self._lock:
+            self.enfileiradas += 1
+            fila = self._pendentes.get(chave)
+            if fila is not None:
+                # Já há uma tarefa do aluno em andamento; ela executará esta depois
+                fila.append((funcao, args))
+                return
+            self._pendentes[chave] = deque([(funcao, args)])
+        self._executor.submit(self._drenar, chave)
+
+    def _drenar(self, chave):
+        while True:
+            with self._lock:
+                fila = self._pendentes[chave]
+                funcao, args = fila[0]
+            try:
+                funcao(*args)
+            except Exception as e:
+                logger.error(
+                    f"Erro ao processar tarefa enfileirada: {e}", exc_info=True
+                )
+            with self._lock:
+                fila.popleft()
+                self.concluidas += 1
+                if not fila:
+                    del self._pendentes[chave]
+                    self._ociosa.notify_all()
+                    return
+
+    def aguardar(self, timeout=30.0) -> bool:
+        """Espera até que não haja tarefas pendentes"""
+        with self._lock:
+            return self._ociosa.wait_for(lambda: not self._pendentes, timeout)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "alunos_com_pendencias": len(self._pendentes),
+                "pendentes": sum(len(fila) for fila in self._pendentes.values()),
+                "enfileiradas": self.enfileiradas,
+                "concluidas": self.concluidas,
+            }
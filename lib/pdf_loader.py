@@ -1,9 +1,54 @@
-import fitz  # PyMuPDF
-
-def carregar_pdf_completo(caminho_pdf: str) -> str:
-    """Lê o conteúdo completo de um arquivo PDF e retorna como string única"""
-    texto = ""
-    with fitz.open(caminho_pdf) as doc:
-        for pagina in doc:
-            texto += pagina.get_text()
-    return texto.strip()
\ No newline at end of file
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF anterior à 1.24.3
+    import fitz as pymupdf
+
+# PDFs com pelo menos essa quantidade de páginas podem ser extraídos em paralelo
+PAGINAS_PARALELO = 200
+
+
+def contar_paginas(caminho_pdf: str) -> int:
+    """Retorna a quantidade de páginas do PDF"""
+    with pymupdf.open(caminho_pdf) as doc:
+        return doc.page_count
+
+
+def iterar_paginas(caminho_pdf: str, inicio: int = 0, fim: int = None):
+    """Gera o texto de cada página do PDF, uma de cada vez"""
+    with pymupdf.open(caminho_pdf) as doc:
+        fim = doc.page_count if fim is None else min(fim, doc.page_count)
+        for numero in range(inicio, fim):
+            yield doc.load_page(numero).get_text()
+
+
+def _extrair_intervalo(args) -> str:
+    caminho_pdf, inicio, fim = args
+    return "".join(iterar_paginas(caminho_pdf, inicio, fim))
+
+
+def _carregar_em_paralelo(caminho_pdf: str, total_paginas: int, processos: int) -> str:
+    passo = -(-total_paginas // processos)
+    intervalos = [
+        (caminho_pdf, inicio, min(inicio + passo, total_paginas))
+        for inicio in range(0, total_paginas, passo)
+    ]
+    # "spawn" evita herdar locks de threads do servidor ao criar os processos
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+        return "".join(pool.map(_extrair_intervalo, intervalos))
+
+
+def carregar_pdf_completo(caminho_pdf: str, processos: int = 1) -> str:
+    """Lê o conteúdo completo de um arquivo PDF e retorna como string única
+
+    Com `processos` > 1, PDFs grandes (PAGINAS_PARALELO ou mais páginas) são
+    divididos em intervalos de páginas extraídos em processos separados.
+    """
+    if processos > 1:
+        total_paginas = contar_paginas(caminho_pdf)
+        if total_paginas >= PAGINAS_PARALELO:
+            return _carregar_em_paralelo(caminho_pdf, total_paginas, processos).strip()
+    return "".join(iterar_paginas(caminho_pdf)).strip()
@@ -0,0 +1,42 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import QuestaoEmitida
+
+logger = logging.getLogger(__name__)
+
+
+def registrar_questao(session, aluno_id, etapa, texto, resposta_correta) -> bool:
+    """Guarda a questão enviada ao aluno para que a correção use exatamente ela"""
+    try:
+        questao = (
+            session.query(QuestaoEmitida)
+            .filter_by(aluno_id=aluno_id, etapa=etapa)
+            .first()
+        )
+        if questao is None:
+            questao = QuestaoEmitida(aluno_id=aluno_id, etapa=etapa)
+            session.add(questao)
+        questao.texto = texto
+        questao.resposta_correta = resposta_correta
+        questao.criado_em = datetime.now().isoformat()
+        session.commit()
+        return True
+    except SQLAlchemyError as e:
+        logger.error(f"Erro ao registrar questão: {e}")
+        session.rollback()
+        return False
+
+
+def buscar_questao(session, aluno_id, etapa):
+    """Retorna a questão emitida para o aluno na etapa ou None"""
+    questao = (
+        session.query(QuestaoEmitida.texto, QuestaoEmitida.resposta_correta)
+        .filter_by(aluno_id=aluno_id, etapa=etapa)
+        .first()
+    )
+    if questao is None:
+        return None
+    return {"question_text": questao[0], "correct_answer": questao[1]}
@@ -0,0 +1,123 @@
+import json
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Questao = namedtuple(
+    "Questao", "modulo topico indice nivel pergunta opcoes resposta letras"
+)
+
+# Ordem em que os níveis aparecem no quiz do módulo
+NIVEIS = ("facil", "medio", "dificil")
+
+
+class MotorQuiz:
+    """Banco de questões da base modular indexado em memória
+
+    As questões ficam em tuplas imutáveis indexadas por (modulo, topico, indice),
+    por (modulo, nivel) e na sequência do quiz de cada módulo, que vai do nível
+    mais fácil ao mais difícil alternando entre os tópicos.
+    """
+
+    def __init__(self, base):
+        self._questoes = {}
+        self._por_nivel = {}
+        self._sequencias = {}
+        self._titulos = {}
+        self._configuracoes = {}
+
+        for modulo, dados in (base.get("modulos") or {}).items():
+            modulo = str(modulo)
+            self._titulos[modulo] = dados.get("titulo", "")
+            self._configuracoes[modulo] = {
+                chave: valor
+                for chave, valor in dados.items()
+                if chave not in ("titulo", "topicos")
+            }
+            questoes_modulo = []
+            contagem = {}
+            for posicao_topico, topico in enumerate(dados.get("topicos", [])):
+                topico_id = topico.get("id", posicao_topico + 1)
+                for indice, item in enumerate(topico.get("quiz", []), start=1):
+                    opcoes = tuple(item.get("opcoes", []))
+                    questao = Questao(
+                        modulo=modulo,
+                        topico=topico_id,
+                        indice=indice,
+                        nivel=item.get("nivel", "medio"),
+                        pergunta=item["pergunta"],
+                        opcoes=opcoes,
+                        resposta=item["resposta"].strip().upper(),
+                        letras="".join(opcao.strip()[:1].upper() for opcao in opcoes),
+                    )
+                    self._questoes[(modulo, topico_id, indice)] = questao
+
+                    # Posição entre as questões do mesmo tópico e nível, para intercalar tópicos
+                    chave_nivel = (topico_id, questao.nivel)
+                    posicao_nivel = contagem.get(chave_nivel, 0)
+                    contagem[chave_nivel] = posicao_nivel + 1
+                    ordem = (_ordem_nivel(questao.nivel), posicao_nivel, posicao_topico)
+                    questoes_modulo.append((ordem, questao))
+
+            for nivel in {questao.nivel for _, questao in questoes_modulo}:
+                self._por_nivel[(modulo, nivel)] = tuple(
+                    questao for _, questao in questoes_modulo if questao.nivel == nivel
+                )
+
+            self._sequencias[modulo] = tuple(
+                questao
+                for _, questao in sorted(questoes_modulo, key=lambda par: par[0])
+            )
+
+    @classmethod
+    def carregar(cls, caminho_json: str) -> "MotorQuiz":
+        """Lê a base modular do disco; um arquivo ausente gera um motor vazio"""
+        try:
+            with open(caminho_json, encoding="utf-8") as arquivo:
+                base = json.load(arquivo)
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao carregar base de questões {caminho_json}: {e}")
+            base = {}
+        motor = cls(base)
+        logger.info(f"Banco de questões carregado: {len(motor._questoes)} questões")
+        return motor
+
+    def modulos(self):
+        return list(self._sequencias)
+
+    def titulo_modulo(self, modulo) -> str:
+        return self._titulos.get(str(modulo), "")
+
+    def config_modulo(self, modulo) -> dict:
+        """Parâmetros do módulo na base modular (ex.: `partes`, `questoes_quiz`)"""
+        return self._configuracoes.get(str(modulo), {})
+
+    def questao(self, modulo, topico, indice):
+        return self._questoes.get((str(modulo), topico, indice))
+
+    def questoes_por_nivel(self, modulo, nivel):
+        return self._por_nivel.get((str(modulo), nivel), ())
+
+    def total_questoes(self, modulo) -> int:
+        return len(self._sequencias.get(str(modulo), ()))
+
+    def questao_do_quiz(self, modulo, numero):
+        """Retorna a questão `numero` (1-based) do quiz do módulo ou None"""
+        sequencia = self._sequencias.get(str(modulo), ())
+        if 1 <= numero <= len(sequencia):
+            return sequencia[numero - 1]
+        return None
+
+    def corrigir(self, modulo, numero, resposta) -> bool:
+        questao = self.questao_do_quiz(modulo, numero)
+        return questao is not None and resposta.strip().upper() == questao.resposta
+
+
+def formatar_questao(questao: Questao, numero) -> str:
+    """Monta o texto da questão no mesmo formato das questões geradas pela IA"""
+    return f"Questão {numero}: {questao.pergunta}\n\n" + "\n".join(questao.opcoes)
+
+
+def _ordem_nivel(nivel):
+    return NIVEIS.index(nivel) if nivel in NIVEIS else len(NIVEIS)
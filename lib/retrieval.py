@@ -0,0 +1,314 @@
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+
+import numpy as np
+
+from lib.chunking import dividir_em_trechos, limpar_texto
+from lib.pdf_loader import carregar_pdf_completo
+
+logger = logging.getLogger(__name__)
+
+# Parâmetros do BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Versão do formato das passagens; índices salvos com outra versão são reconstruídos
+VERSAO_INDICE = 2
+
+# Tipos de passagem: trecho dos PDFs ou enunciado da base modular
+PASSAGEM_PDF = "pdf"
+PASSAGEM_BASE = "base"
+
+_PALAVRA = re.compile(r"\w+")
+
+STOPWORDS = frozenset(
+    """a ao aos as com como da das de do dos e ela ele em entre era essa esse esta
+    este eu foi ha isso ja la mais mas me meu minha na nas no nos nao o os ou para
+    pela pelo por qual quais que se sem ser seu sua sao so tambem te tem um uma
+    voce voces""".split()
+)
+
+
+def tokenizar(texto: str):
+    """Termos normalizados (minúsculos, sem acento e sem stopwords) do texto"""
+    normalizado = unicodedata.normalize("NFKD", texto.lower())
+    normalizado = "".join(c for c in normalizado if not unicodedata.combining(c))
+    return [
+        termo
+        for termo in _PALAVRA.findall(normalizado)
+        if len(termo) > 1 and termo not in STOPWORDS
+    ]
+
+
+def assinatura_fontes(caminhos) -> dict:
+    """(mtime, tamanho) de cada fonte, usado para saber se o índice está desatualizado"""
+    assinatura = {}
+    for caminho in caminhos:
+        stat = os.stat(caminho)
+        assinatura[caminho] = [stat.st_mtime_ns, stat.st_size]
+    return assinatura
+
+
+def montar_passagens(
+    pasta_pdfs: str, caminho_base_json: str = None, carregar_texto=None
+):
+    """Passagens do curso: trechos dos PDFs e tópicos/questões da base modular
+
+    `carregar_texto` devolve o texto de um PDF (padrão: extração direta); a
+    aplicação passa o cache de texto dos módulos para não extrair de novo. Das
+    questões entra apenas o enunciado com o título do tópico; as alternativas
+    ficam de fora para que a busca nunca entregue a resposta de uma questão.
+    """
+    carregar_texto = carregar_texto or carregar_pdf_completo
+    passagens = []
+    for caminho_pdf in sorted(glob.glob(os.path.join(pasta_pdfs, "modulo_*.pdf"))):
+        fonte = os.path.basename(caminho_pdf)
+        for trecho in dividir_em_trechos(carregar_texto(caminho_pdf)):
+            passagens.append(
+                {"fonte": fonte, "tipo": PASSAGEM_PDF, "texto": trecho.texto}
+            )
+
+    if caminho_base_json and os.path.exists(caminho_base_json):
+        with open(caminho_base_json, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)
+        for numero, modulo in (base.get("modulos") or {}).items():
+            for topico in modulo.get("topicos", []):
+                titulo = topico.get("titulo", "")
+                fonte = f"modulo {numero} - {titulo}"
+                for questao in topico.get("quiz", []):
+                    texto = limpar_texto(f"{titulo}: {questao['pergunta']}")
+                    passagens.append(
+                        {"fonte": fonte, "tipo": PASSAGEM_BASE, "texto": texto}
+                    )
+    return passagens
+
+
+class IndiceBusca:
+    """Índice BM25 em NumPy com listas invertidas de pesos pré-calculados
+
+    Para cada termo, `offsets[t]:offsets[t + 1]` delimita em `documentos` e `pesos`
+    os documentos que contêm o termo e o peso BM25 já calculado. Uma busca é só a
+    soma desses pesos, sem recalcular frequências.
+    """
+
+    ARQUIVOS = ("offsets.npy", "documentos.npy", "pesos.npy")
+
+    # Arquivo com o nome da subpasta da versão em uso do índice
+    ATUAL = "ATUAL"
+
+    def __init__(
+        self,
+        vocabulario,
+        offsets,
+        documentos,
+        pesos,
+        passagens,
+        fontes=None,
+        versao=VERSAO_INDICE,
+        pasta=None,
+    ):
+        self.vocabulario = vocabulario
+        self.offsets = offsets
+        self.documentos = documentos
+        self.pesos = pesos
+        self.passagens = passagens
+        self.fontes = fontes or {}
+        self.versao = versao
+        self.pasta = pasta  # subpasta de onde o índice foi carregado
+        self._da_base = np.array(
+            [passagem.get("tipo") == PASSAGEM_BASE for passagem in passagens],
+            dtype=bool,
+        )
+
+    @classmethod
+    def construir(cls, passagens, fontes=None) -> "IndiceBusca":
+        documentos_termos = [tokenizar(passagem["texto"]) for passagem in passagens]
+        vocabulario = {}
+        frequencias = {}  # termo_id -> {documento: frequência}
+        for documento, termos in enumerate(documentos_termos):
+            for termo in termos:
+                termo_id = vocabulario.setdefault(termo, len(vocabulario))
+                por_documento = frequencias.setdefault(termo_id, {})
+                por_documento[documento] = por_documento.get(documento, 0) + 1
+
+        total_documentos = max(len(passagens), 1)
+        tamanhos = np.array(
+            [len(termos) for termos in documentos_termos] or [0], dtype=np.float32
+        )
+        tamanho_medio = float(tamanhos.mean()) or 1.0
+
+        offsets = np.zeros(len(vocabulario) + 1, dtype=np.int64)
+        lista_documentos = []
+        lista_pesos = []
+        for termo_id in range(len(vocabulario)):
+            por_documento = frequencias[termo_id]
+            docs = np.fromiter(
+                por_documento.keys(), dtype=np.int32, count=len(por_documento)
+            )
+            tf = np.fromiter(
+                por_documento.values(), dtype=np.float32, count=len(por_documento)
+            )
+            idf = np.log(1 + (total_documentos - len(docs) + 0.5) / (len(docs) + 0.5))
+            normalizacao = BM25_K1 * (
+                1 - BM25_B + BM25_B * tamanhos[docs] / tamanho_medio
+            )
+            lista_documentos.append(docs)
+            lista_pesos.append(
+                (idf * tf * (BM25_K1 + 1) / (tf + normalizacao)).astype(np.float32)
+            )
+            offsets[termo_id + 1] = offsets[termo_id] + len(docs)
+
+        documentos = (
+            np.concatenate(lista_documentos)
+            if lista_documentos
+            else np.zeros(0, np.int32)
+        )
+        pesos = np.concatenate(lista_pesos) if lista_pesos else np.zeros(0, np.float32)
+        return cls(vocabulario, offsets, documentos, pesos, passagens, fontes)
+
+    def salvar(self, pasta: str):
+        """Grava o índice numa subpasta nova e só então a torna a versão em uso
+
+        Outros processos podem estar lendo a versão anterior com mmap: os arquivos
+        dela nunca são reescritos, e o ponteiro ATUAL é trocado com `os.replace`,
+        então um leitor vê sempre arrays e meta de uma mesma construção.
+        """
+        os.makedirs(pasta, exist_ok=True)
+        versao = tempfile.mkdtemp(prefix="versao-", dir=pasta)
+        for nome, array in zip(
+            self.ARQUIVOS, (self.offsets, self.documentos, self.pesos)
+        ):
+            np.save(os.path.join(versao, nome), array)
+        with open(os.path.join(versao, "meta.json"), "w", encoding="utf-8") as arquivo:
+            json.dump(
+                {
+                    "vocabulario": self.vocabulario,
+                    "passagens": self.passagens,
+                    "fontes": self.fontes,
+                    "versao": self.versao,
+                },
+                arquivo,
+                ensure_ascii=False,
+            )
+
+        anterior = _versao_atual(pasta)
+        descritor, temporario = tempfile.mkstemp(prefix="ATUAL-", dir=pasta)
+        with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+            arquivo.write(os.path.basename(versao))
+        os.replace(temporario, os.path.join(pasta, self.ATUAL))
+
+        # Mantém a versão anterior para quem acabou de ler o ponteiro antigo;
+        # arquivos removidos continuam válidos para quem já os mapeou
+        manter = {os.path.basename(versao), anterior}
+        for nome in os.listdir(pasta):
+            if nome.startswith("versao-") and nome not in manter:
+                shutil.rmtree(os.path.join(pasta, nome), ignore_errors=True)
+
+    @classmethod
+    def carregar(cls, pasta: str) -> "IndiceBusca":
+        """Abre a versão em uso do índice; os arrays são mapeados em memória"""
+        versao = _versao_atual(pasta)
+        if versao is None:
+            raise FileNotFoundError(os.path.join(pasta, cls.ATUAL))
+        subpasta = os.path.join(pasta, versao)
+        with open(os.path.join(subpasta, "meta.json"), encoding="utf-8") as arquivo:
+            meta = json.load(arquivo)
+        offsets, documentos, pesos = (
+            np.load(os.path.join(subpasta, nome), mmap_mode="r")
+            for nome in cls.ARQUIVOS
+        )
+        return cls(
+            meta["vocabulario"],
+            offsets,
+            documentos,
+            pesos,
+            meta["passagens"],
+            meta["fontes"],
+            meta.get("versao", 1),
+            versao,
+        )
+
+    def substituido(self, pasta: str) -> bool:
+        """Indica se outra versão do índice passou a ser a versão em uso"""
+        try:
+            return _versao_atual(pasta) != self.pasta
+        except OSError:
+            return False
+
+    def desatualizado(self) -> bool:
+        """Indica se alguma fonte mudou ou sumiu desde a construção do índice"""
+        if self.versao != VERSAO_INDICE:
+            return True
+        try:
+            return assinatura_fontes(self.fontes) != self.fontes
+        except OSError:
+            return True
+
+    def buscar(self, consulta: str, k: int = 3, incluir_base: bool = True):
+        """Retorna até `k` passagens mais relevantes como (pontuação, passagem)
+
+        Com `incluir_base=False`, apenas trechos dos PDFs, sem enunciados da base.
+        """
+        termos = {
+            self.vocabulario[t] for t in tokenizar(consulta) if t in self.vocabulario
+        }
+        if not termos:
+            return []
+
+        pontuacoes = np.zeros(len(self.passagens), dtype=np.float32)
+        for termo_id in termos:
+            inicio, fim = self.offsets[termo_id], self.offsets[termo_id + 1]
+            pontuacoes[self.documentos[inicio:fim]] += self.pesos[inicio:fim]
+        if not incluir_base:
+            pontuacoes[self._da_base] = 0
+
+        k = min(k, len(pontuacoes))
+        melhores = np.argpartition(-pontuacoes, k - 1)[:k]
+        melhores = melhores[np.argsort(-pontuacoes[melhores])]
+        return [
+            (float(pontuacoes[i]), self.passagens[i])
+            for i in melhores
+            if pontuacoes[i] > 0
+        ]
+
+
+def _versao_atual(pasta):
+    try:
+        with open(os.path.join(pasta, IndiceBusca.ATUAL), encoding="utf-8") as arquivo:
+            return arquivo.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def carregar_ou_construir(
+    pasta_indice: str, pasta_pdfs: str, caminho_base_json: str, carregar_texto=None
+):
+    """Abre o índice salvo ou o reconstrói quando não existe ou está desatualizado"""
+    try:
+        indice = IndiceBusca.carregar(pasta_indice)
+        if not indice.desatualizado():
+            return indice
+        logger.info("Índice de busca desatualizado, reconstruindo")
+    except (OSError, ValueError, KeyError):
+        logger.info("Índice de busca não encontrado, construindo")
+
+    return construir_indice(pasta_indice, pasta_pdfs, caminho_base_json, carregar_texto)
+
+
+def construir_indice(
+    pasta_indice: str, pasta_pdfs: str, caminho_base_json: str, carregar_texto=None
+):
+    """Constrói o índice a partir das fontes do curso, salva e reabre com mmap"""
+    fontes = sorted(glob.glob(os.path.join(pasta_pdfs, "modulo_*.pdf")))
+    if caminho_base_json and os.path.exists(caminho_base_json):
+        fontes.append(caminho_base_json)
+    passagens = montar_passagens(pasta_pdfs, caminho_base_json, carregar_texto)
+    IndiceBusca.construir(passagens, assinatura_fontes(fontes)).salvar(pasta_indice)
+    logger.info(f"Índice de busca construído com {len(passagens)} passagens")
+    return IndiceBusca.carregar(pasta_indice)
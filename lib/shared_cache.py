@@ -0,0 +1,255 @@
+"""Backends de cache compartilhável entre threads e processos
+
+Todos os backends têm a mesma interface, com chaves e valores em texto:
+
+- `obter(chave)`: valor ou None se ausente/expirado
+- `gravar(chave, valor, ttl=None)`: grava ou substitui
+- `adicionar(chave, valor, ttl=None)`: grava só se ausente; True se gravou
+- `remover(chave)`
+- `travar(chave, espaco=0)`: context manager de exclusão mútua para a chave,
+  usado para calcular um valor uma única vez. Chaves de espaços diferentes nunca
+  dividem trava, então travas de espaços distintos podem ser aninhadas sem risco
+  de deadlock (por exemplo, a do aluno por fora e a de uma chamada à IA por dentro)
+- `estatisticas()`
+
+`BackendMemoria` vale para um único processo. `BackendSQLite` guarda os valores
+em um arquivo SQLite que todos os workers (uvicorn --workers) abrem, e trava as
+chaves também entre processos.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: travas apenas entre threads do mesmo processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Espaços de travas: as do cache (texto dos PDFs, IA), as dos alunos e as do
+# índice de busca, que envolve leituras do texto dos PDFs
+ESPACO_CACHE = 0
+ESPACO_ALUNO = 1
+ESPACO_INDICE = 2
+
+
+class _Travas:
+    """Travas por faixa de chaves; com `arquivo`, valem também entre processos
+
+    Cada espaço tem suas próprias `faixas`, em posições separadas do arquivo.
+    """
+
+    def __init__(self, faixas=1024, arquivo=None, espacos=3):
+        self._faixas = faixas
+        self._locks = [threading.Lock() for _ in range(faixas * espacos)]
+        self._arquivo = arquivo
+        self._descritor = None
+        self._abertura = threading.Lock()
+
+    @contextmanager
+    def travar(self, chave, espaco=0):
+        faixa = espaco * self._faixas + zlib.crc32(chave.encode()) % self._faixas
+        with self._locks[faixa]:
+            if self._arquivo is None or fcntl is None:
+                yield
+                return
+            # Trava de um byte na posição da faixa: outros processos esperam
+            descritor = self._abrir()
+            fcntl.lockf(descritor, fcntl.LOCK_EX, 1, faixa)
+            try:
+                yield
+            finally:
+                fcntl.lockf(descritor, fcntl.LOCK_UN, 1, faixa)
+
+    def _abrir(self):
+        # Um único descritor por processo: fechar qualquer descritor do arquivo
+        # liberaria todas as travas do processo
+        with self._abertura:
+            if self._descritor is None:
+                self._descritor = os.open(self._arquivo, os.O_RDWR | os.O_CREAT, 0o644)
+            return self._descritor
+
+
+# Descritores das travas de processo: mantidos abertos até o processo terminar,
+# pois fechar um descritor do arquivo liberaria a trava
+_TRAVAS_PROCESSO = []
+
+
+def travar_processo(caminho) -> bool:
+    """Trava o arquivo para este processo até ele terminar
+
+    Retorna False se outro processo já tem a trava. Sem fcntl (Windows), não há
+    como verificar e a função sempre retorna True.
+    """
+    if fcntl is None:
+        return True
+    descritor = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.lockf(descritor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(descritor)
+        return False
+    _TRAVAS_PROCESSO.append(descritor)
+    return True
+
+
+class BackendMemoria:
+    """Cache LRU em memória, limitado pelo número de entradas"""
+
+    def __init__(self, capacidade=10000):
+        self._capacidade = capacidade
+        self._entradas = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self._travas = _Travas()
+        self.hits = 0
+        self.misses = 0
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._valido(chave)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def gravar(self, chave, valor, ttl=None):
+        with self._lock:
+            self._guardar(chave, valor, ttl)
+
+    def adicionar(self, chave, valor, ttl=None) -> bool:
+        with self._lock:
+            if self._valido(chave) is not None:
+                return False
+            self._guardar(chave, valor, ttl)
+            return True
+
+    def remover(self, chave):
+        with self._lock:
+            self._entradas.pop(chave, None)
+
+    def travar(self, chave, espaco=0):
+        return self._travas.travar(chave, espaco)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memoria",
+                "entradas": len(self._entradas),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _valido(self, chave):
+        item = self._entradas.get(chave)
+        if item is not None and item[0] is not None and item[0] < time.time():
+            del self._entradas[chave]
+            return None
+        return item
+
+    def _guardar(self, chave, valor, ttl):
+        expira_em = time.time() + ttl if ttl else None
+        self._entradas[chave] = (expira_em, valor)
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > self._capacidade:
+            self._entradas.popitem(last=False)
+
+
+class BackendSQLite:
+    """Cache em um arquivo SQLite compartilhado por todos os processos
+
+    Cada thread usa sua própria conexão em modo WAL, então leituras de vários
+    workers não se bloqueiam. Entradas expiradas são removidas periodicamente.
+    """
+
+    def __init__(self, caminho, limpeza_a_cada=1000):
+        self._caminho = caminho
+        self._local = threading.local()
+        self._travas = _Travas(arquivo=f"{caminho}.lock")
+        self._limpeza_a_cada = limpeza_a_cada
+        self._gravacoes = 0
+        self.hits = 0
+        self.misses = 0
+        self._conexao().execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "chave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira_em REAL)"
+        )
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self._caminho, timeout=5, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.execute(f"PRAGMA mmap_size={256 * 1024 * 1024}")
+            self._local.conexao = conexao
+        return conexao
+
+    def obter(self, chave):
+        linha = (
+            self._conexao()
+            .execute(
+                "SELECT valor FROM cache WHERE chave = ? "
+                "AND (expira_em IS NULL OR expira_em >= ?)",
+                (chave, time.time()),
+            )
+            .fetchone()
+        )
+        if linha is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return linha[0]
+
+    def gravar(self, chave, valor, ttl=None):
+        self._executar_gravacao(
+            "INSERT OR REPLACE INTO cache (chave, valor, expira_em) VALUES (?, ?, ?)",
+            (chave, valor, time.time() + ttl if ttl else None),
+        )
+
+    def adicionar(self, chave, valor, ttl=None) -> bool:
+        # Substitui apenas uma entrada expirada; uma entrada válida é mantida
+        agora = time.time()
+        cursor = self._executar_gravacao(
+            "INSERT INTO cache (chave, valor, expira_em) VALUES (?, ?, ?) "
+            "ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor, "
+            "expira_em = excluded.expira_em "
+            "WHERE cache.expira_em IS NOT NULL AND cache.expira_em < ?",
+            (chave, valor, agora + ttl if ttl else None, agora),
+        )
+        return cursor.rowcount == 1
+
+    def remover(self, chave):
+        self._executar_gravacao("DELETE FROM cache WHERE chave = ?", (chave,))
+
+    def travar(self, chave, espaco=0):
+        return self._travas.travar(chave, espaco)
+
+    def estatisticas(self) -> dict:
+        (entradas,) = self._conexao().execute("SELECT COUNT(*) FROM cache").fetchone()
+        return {
+            "backend": "sqlite",
+            "caminho": self._caminho,
+            "entradas": entradas,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _executar_gravacao(self, sql, parametros):
+        conexao = self._conexao()
+        cursor = conexao.execute(sql, parametros)
+        self._gravacoes += 1
+        if self._gravacoes % self._limpeza_a_cada == 0:
+            try:
+                conexao.execute("DELETE FROM cache WHERE expira_em < ?", (time.time(),))
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao limpar cache compartilhado: {e}")
+        return cursor
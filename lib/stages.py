@@ -0,0 +1,94 @@
+from collections import namedtuple
+
+Etapa = namedtuple(
+    "Etapa", "nome tipo modulo numero total proxima anterior campo mensagem"
+)
+
+# Tipos de etapa; cada tipo tem um tratador na tabela de despacho do webhook
+INICIO = "inicio"
+PERFIL = "perfil"
+PRONTO = "pronto"
+AULA = "aula"
+QUIZ = "quiz"
+RESULTADO = "resultado"  # corrige a última questão do quiz e encerra o módulo
+FIM = "fim"
+
+ETAPA_INICIAL = "inicio"
+ETAPA_PRONTO = "pronto"
+ETAPA_CONCLUIDO = "concluido"
+
+
+def nome_aula(modulo, parte) -> str:
+    return f"modulo_pdf_{modulo}_{parte}"
+
+
+def nome_quiz(modulo, questao) -> str:
+    return f"quiz_modulo_{modulo}_{questao}"
+
+
+def nome_resultado(modulo) -> str:
+    return f"quiz_modulo_{modulo}_resultado"
+
+
+def _etapa(nome, tipo, proxima=None, **campos):
+    valores = dict.fromkeys(Etapa._fields)
+    valores.update(campos, nome=nome, tipo=tipo, proxima=proxima)
+    return Etapa(**valores)
+
+
+def compilar_etapas(passos_perfil, modulos) -> dict:
+    """Compila o grafo de etapas do curso em uma tabela {nome da etapa: Etapa}
+
+    `passos_perfil` é a sequência (etapa, campo do perfil, mensagem) da coleta de
+    perfil e `modulos` a sequência ordenada (modulo, partes, questoes) do curso.
+    Cada etapa já traz módulo, número e vizinhas resolvidos, então atender uma
+    mensagem é uma consulta ao dicionário, sem interpretar o nome da etapa.
+    """
+    # Nomes em ordem: coleta de perfil, aulas e quiz de cada módulo, conclusão
+    sequencia = [nome for nome, _, _ in passos_perfil] + [ETAPA_PRONTO]
+    for modulo, partes, questoes in modulos:
+        sequencia += [nome_aula(modulo, parte) for parte in range(1, partes + 1)]
+        sequencia += [nome_quiz(modulo, questao) for questao in range(1, questoes + 1)]
+        if questoes:
+            sequencia.append(nome_resultado(modulo))
+    sequencia.append(ETAPA_CONCLUIDO)
+    seguinte = dict(zip(sequencia, sequencia[1:]))
+
+    etapas = {ETAPA_INICIAL: _etapa(ETAPA_INICIAL, INICIO, sequencia[0])}
+    for nome, campo, mensagem in passos_perfil:
+        etapas[nome] = _etapa(
+            nome, PERFIL, seguinte[nome], campo=campo, mensagem=mensagem
+        )
+    etapas[ETAPA_PRONTO] = _etapa(ETAPA_PRONTO, PRONTO, seguinte[ETAPA_PRONTO])
+
+    for modulo, partes, questoes in modulos:
+        modulo = str(modulo)
+        for parte in range(1, partes + 1):
+            nome = nome_aula(modulo, parte)
+            etapas[nome] = _etapa(
+                nome, AULA, seguinte[nome], modulo=modulo, numero=parte, total=partes
+            )
+        for questao in range(1, questoes + 1):
+            nome = nome_quiz(modulo, questao)
+            etapas[nome] = _etapa(
+                nome,
+                QUIZ,
+                seguinte[nome],
+                modulo=modulo,
+                numero=questao,
+                total=questoes,
+                anterior=nome_quiz(modulo, questao - 1) if questao > 1 else None,
+            )
+        if questoes:
+            # A resposta à última questão chega nesta etapa, que a corrige
+            nome = nome_resultado(modulo)
+            etapas[nome] = _etapa(
+                nome,
+                RESULTADO,
+                seguinte[nome],
+                modulo=modulo,
+                anterior=nome_quiz(modulo, questoes),
+            )
+
+    etapas[ETAPA_CONCLUIDO] = _etapa(ETAPA_CONCLUIDO, FIM)
+    return etapas
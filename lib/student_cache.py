@@ -0,0 +1,141 @@
+import copy
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# Campos do aluno mantidos em memória e gravados quando alterados
+CAMPOS = ("etapa", "perfil", "pontuacao", "resumo", "resumo_ate")
+
+
+class EstadoAluno:
+    """Estado de um aluno ativo com o último valor gravado para detectar alterações"""
+
+    __slots__ = ("id", "numero_whatsapp", "_salvo") + CAMPOS
+
+    def __init__(
+        self, id, numero_whatsapp, etapa, perfil, pontuacao, resumo=None, resumo_ate=0
+    ):
+        self.id = id
+        self.numero_whatsapp = numero_whatsapp
+        self.etapa = etapa
+        self.perfil = perfil or {}
+        self.pontuacao = pontuacao or 0
+        self.resumo = resumo or ""
+        self.resumo_ate = resumo_ate or 0
+        self.marcar_salvo()
+
+    def marcar_salvo(self):
+        self._salvo = {campo: copy.deepcopy(getattr(self, campo)) for campo in CAMPOS}
+
+    def campos_alterados(self) -> dict:
+        return {
+            campo: getattr(self, campo)
+            for campo in CAMPOS
+            if getattr(self, campo) != self._salvo[campo]
+        }
+
+
+class CacheAlunos:
+    """Cache LRU dos alunos ativos, indexado pelo número do WhatsApp
+
+    As leituras de alunos em cache não vão ao banco e `salvar` grava apenas os
+    campos alterados. `lock(numero)` serializa as mensagens de um mesmo número;
+    os locks são distribuídos em faixas fixas para não crescer com os alunos.
+    O cache pressupõe que as mensagens de um aluno são atendidas por um único
+    processo; com vários processos, use `invalidar` ao receber alterações externas.
+    """
+
+    def __init__(self, session_factory, modelo, capacidade=10000, faixas_lock=1024):
+        self._session_factory = session_factory
+        self._modelo = modelo
+        self._capacidade = capacidade
+        self._alunos = OrderedDict()
+        self._guarda = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(faixas_lock)]
+        self.hits = 0
+        self.misses = 0
+        self.gravacoes = 0
+
+    def lock(self, numero_whatsapp):
+        """Lock que serializa o processamento das mensagens do número"""
+        indice = zlib.crc32(numero_whatsapp.encode()) % len(self._locks)
+        return self._locks[indice]
+
+    def obter(self, session, numero_whatsapp) -> EstadoAluno:
+        """Estado do aluno em cache; busca ou cria no banco apenas se ausente"""
+        with self._guarda:
+            estado = self._alunos.get(numero_whatsapp)
+            if estado is not None:
+                self._alunos.move_to_end(numero_whatsapp)
+                self.hits += 1
+                return estado
+            self.misses += 1
+
+        registro = (
+            session.query(self._modelo)
+            .filter_by(numero_whatsapp=numero_whatsapp)
+            .first()
+        )
+        if registro is None:
+            logger.info(f"Criando novo aluno para {numero_whatsapp}")
+            registro = self._modelo(
+                numero_whatsapp=numero_whatsapp, etapa="inicio", perfil={}, pontuacao=0
+            )
+            session.add(registro)
+            session.commit()
+
+        estado = EstadoAluno(
+            registro.id,
+            numero_whatsapp,
+            registro.etapa,
+            registro.perfil,
+            registro.pontuacao,
+            registro.resumo,
+            registro.resumo_ate,
+        )
+        with self._guarda:
+            self._alunos[numero_whatsapp] = estado
+            while len(self._alunos) > self._capacidade:
+                self._alunos.popitem(last=False)
+        return estado
+
+    def salvar(self, session, estado: EstadoAluno) -> bool:
+        """Grava no banco apenas os campos alterados desde a última gravação"""
+        alterados = estado.campos_alterados()
+        if not alterados:
+            return True
+        try:
+            session.query(self._modelo).filter_by(id=estado.id).update(
+                alterados, synchronize_session=False
+            )
+            session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Erro ao atualizar aluno: {e}")
+            session.rollback()
+            # O banco continua com o valor antigo: a próxima leitura recarrega
+            self.invalidar(estado.numero_whatsapp)
+            return False
+        estado.marcar_salvo()
+        self.gravacoes += 1
+        return True
+
+    def invalidar(self, numero_whatsapp):
+        with self._guarda:
+            self._alunos.pop(numero_whatsapp, None)
+
+    def estatisticas(self) -> dict:
+        with self._guarda:
+            total = self.hits + self.misses
+            return {
+                "alunos": len(self._alunos),
+                "capacidade": self._capacidade,
+                "hits": self.hits,
+                "misses": self.misses,
+                "gravacoes": self.gravacoes,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
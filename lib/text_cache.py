@@ -0,0 +1,179 @@
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from lib.chunking import dividir_em_trechos
+
+logger = logging.getLogger(__name__)
+
+
+class CacheTextoModulos:
+    """Cache LRU do texto extraído dos PDFs, limitado pelo uso de memória
+
+    Cada entrada guarda o mtime do arquivo; se o PDF for alterado a entrada é
+    descartada e o texto extraído novamente na próxima leitura. Com um backend
+    `compartilhado` (ver lib.shared_cache), o texto extraído por um processo é
+    reaproveitado pelos demais e cada PDF é extraído uma única vez.
+
+    A divisão do texto em trechos (`trechos`) é feita uma vez por entrada e
+    guardada com ela; o tamanho dos trechos conta no limite de `max_bytes`.
+    """
+
+    def __init__(self, extrair, max_bytes=64 * 1024 * 1024, compartilhado=None):
+        self._extrair = extrair
+        self._max_bytes = max_bytes
+        self._compartilhado = compartilhado
+        # caminho -> (mtime_ns, texto, tamanho, trechos ou None)
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._locks = {}  # caminho -> lock da extração em andamento
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalescidas = 0
+
+    def obter(self, caminho_pdf: str) -> str:
+        """Retorna o texto do PDF, extraindo apenas quando não está em cache
+
+        Leituras simultâneas do mesmo PDF ausente esperam uma única extração.
+        """
+        mtime = os.stat(caminho_pdf).st_mtime_ns
+        texto = self._buscar(caminho_pdf, mtime)
+        if texto is not None:
+            return texto
+
+        with self._lock_para(caminho_pdf):
+            # Outra thread pode ter extraído o texto enquanto esperávamos o lock
+            texto = self._buscar(caminho_pdf, mtime, contar=False)
+            if texto is not None:
+                with self._lock:
+                    self.coalescidas += 1
+                return texto
+
+            if self._compartilhado is None:
+                texto = self._extrair(caminho_pdf)
+            else:
+                texto = self._obter_compartilhado(caminho_pdf, mtime)
+            if texto:
+                self._guardar(caminho_pdf, mtime, texto)
+            return texto
+
+    def trechos(self, caminho_pdf: str):
+        """Trechos do texto do PDF (ver lib.chunking), divididos uma única vez"""
+        texto = self.obter(caminho_pdf)
+        if not texto:
+            return ()
+        with self._lock:
+            entrada = self._entradas.get(caminho_pdf)
+            if entrada and entrada[1] is texto and entrada[3] is not None:
+                return entrada[3]
+
+        trechos = dividir_em_trechos(texto)
+        tamanho = _tamanho_trechos(trechos)
+        with self._lock:
+            entrada = self._entradas.get(caminho_pdf)
+            # A entrada pode ter sido descartada ou substituída durante a divisão
+            if entrada and entrada[1] is texto and entrada[3] is None:
+                self._entradas[caminho_pdf] = (
+                    entrada[0],
+                    texto,
+                    entrada[2] + tamanho,
+                    trechos,
+                )
+                self._bytes += tamanho
+                self._descartar_excedente()
+        return trechos
+
+    def _buscar(self, caminho_pdf, mtime, contar=True):
+        with self._lock:
+            entrada = self._entradas.get(caminho_pdf)
+            if entrada and entrada[0] == mtime:
+                self._entradas.move_to_end(caminho_pdf)
+                if contar:
+                    self.hits += 1
+                return entrada[1]
+            if contar:
+                self.misses += 1
+            if entrada:
+                self._remover(caminho_pdf)
+            return None
+
+    def _lock_para(self, caminho_pdf):
+        with self._lock:
+            return self._locks.setdefault(caminho_pdf, threading.Lock())
+
+    def _obter_compartilhado(self, caminho_pdf, mtime):
+        # O valor guarda o mtime do PDF extraído: "mtime:texto"
+        chave = f"texto_pdf:{os.path.abspath(caminho_pdf)}"
+        versao = f"{mtime}:"
+        valor = self._compartilhado.obter(chave)
+        if valor is None or not valor.startswith(versao):
+            with self._compartilhado.travar(chave):
+                # Outro processo pode ter extraído enquanto esperávamos
+                valor = self._compartilhado.obter(chave)
+                if valor is None or not valor.startswith(versao):
+                    texto = self._extrair(caminho_pdf)
+                    if texto:
+                        self._compartilhado.gravar(chave, versao + texto)
+                    return texto
+        return valor[len(versao) :]
+
+    def pre_carregar(self, caminhos) -> int:
+        """Extrai e guarda o texto de todos os caminhos informados"""
+        carregados = 0
+        for caminho in caminhos:
+            if self.obter(caminho):
+                carregados += 1
+        logger.info(f"{carregados} módulos pré-carregados no cache de texto")
+        return carregados
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalescidas": self.coalescidas,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def _guardar(self, caminho_pdf, mtime, texto):
+        tamanho = sys.getsizeof(texto)
+        if tamanho > self._max_bytes:
+            logger.warning(f"Texto de {caminho_pdf} excede o limite do cache")
+            return
+        with self._lock:
+            if caminho_pdf in self._entradas:
+                self._remover(caminho_pdf)
+            self._entradas[caminho_pdf] = (mtime, texto, tamanho, None)
+            self._bytes += tamanho
+            self._descartar_excedente()
+
+    def _descartar_excedente(self):
+        while self._bytes > self._max_bytes:
+            antigo = next(iter(self._entradas))
+            self._remover(antigo)
+            self.evictions += 1
+
+    def _remover(self, caminho_pdf):
+        tamanho = self._entradas.pop(caminho_pdf)[2]
+        self._bytes -= tamanho
+
+
+def _tamanho_trechos(trechos):
+    # A tupla, cada Trecho e o texto limpo; os offsets são inteiros pequenos
+    return sys.getsizeof(trechos) + sum(
+        sys.getsizeof(trecho) + sys.getsizeof(trecho.texto) for trecho in trechos
+    )
@@ -0,0 +1,176 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+logger = logging.getLogger(__name__)
+
+_PARAR = object()
+
+
+class FilaGravacao:
+    """Fila write-behind que grava linhas em lote numa thread dedicada
+
+    As linhas são inseridas com uma sessão própria da thread quando o lote atinge
+    `tamanho_lote` ou quando `intervalo` segundos se passam desde a primeira linha
+    pendente. `parar()` grava tudo o que ainda estiver na fila antes de encerrar.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        modelo,
+        tamanho_lote=100,
+        intervalo=0.5,
+        max_fila=10000,
+        tentativas=3,
+    ):
+        self._session_factory = session_factory
+        self._modelo = modelo
+        self._tamanho_lote = tamanho_lote
+        self._intervalo = intervalo
+        self._tentativas = tentativas
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.parar)
+
+        self.enfileiradas = 0
+        self.gravadas = 0
+        self.descartadas = 0
+        self.lotes = 0
+        self.ultima_latencia = 0.0
+        self.latencia_maxima = 0.0
+        self._latencia_total = 0.0
+
+    def iniciar(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._executar, name="fila-gravacao", daemon=True
+            )
+            self._thread.start()
+
+    def enfileirar(self, linha: dict, timeout=5.0) -> bool:
+        """Agenda a gravação da linha; bloqueia até `timeout` se a fila estiver cheia"""
+        self.iniciar()
+        try:
+            self._fila.put(linha, timeout=timeout)
+        except queue.Full:
+            logger.error("Fila de gravação cheia, linha descartada")
+            self.descartadas += 1
+            return False
+        self.enfileiradas += 1
+        return True
+
+    def aguardar(self, timeout=10.0) -> bool:
+        """Espera até que todas as linhas enfileiradas tenham sido gravadas"""
+        limite = time.monotonic() + timeout
+        while self._fila.unfinished_tasks:
+            if time.monotonic() > limite:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def parar(self, timeout=10.0):
+        """Grava as linhas pendentes e encerra a thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if not thread or not thread.is_alive():
+            return
+        self._fila.put(_PARAR)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error("Fila de gravação não terminou dentro do tempo limite")
+
+    def profundidade(self) -> int:
+        return self._fila.qsize()
+
+    def estatisticas(self) -> dict:
+        return {
+            "profundidade": self.profundidade(),
+            "enfileiradas": self.enfileiradas,
+            "gravadas": self.gravadas,
+            "descartadas": self.descartadas,
+            "lotes": self.lotes,
+            "ultima_latencia": self.ultima_latencia,
+            "latencia_maxima": self.latencia_maxima,
+            "latencia_media": self._latencia_total / self.lotes if self.lotes else 0.0,
+        }
+
+    def _executar(self):
+        parar = False
+        while not parar:
+            lote, retirados, parar = self._coletar_lote()
+            if lote:
+                self._gravar(lote)
+            for _ in range(retirados):
+                self._fila.task_done()
+
+    def _coletar_lote(self):
+        """Retira o próximo lote da fila: (linhas, itens retirados, parar)"""
+        linha = self._fila.get()
+        retirados = 1
+        if linha is _PARAR:
+            return self._drenar([], retirados)
+
+        lote = [linha]
+        limite = time.monotonic() + self._intervalo
+        while len(lote) < self._tamanho_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                linha = self._fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            retirados += 1
+            if linha is _PARAR:
+                return self._drenar(lote, retirados)
+            lote.append(linha)
+        return lote, retirados, False
+
+    def _drenar(self, lote, retirados):
+        # Ao parar, grava também o que ainda estiver na fila
+        while True:
+            try:
+                linha = self._fila.get_nowait()
+            except queue.Empty:
+                return lote, retirados, True
+            retirados += 1
+            if linha is not _PARAR:
+                lote.append(linha)
+
+    def _gravar(self, lote):
+        inicio = time.perf_counter()
+        for tentativa in range(1, self._tentativas + 1):
+            session = self._session_factory()
+            try:
+                session.execute(insert(self._modelo), lote)
+                session.commit()
+                break
+            except Exception as e:
+                # Qualquer erro é tratado aqui para a thread de gravação não morrer
+                session.rollback()
+                logger.error(
+                    f"Erro ao gravar lote de {len(lote)} linhas "
+                    f"(tentativa {tentativa}): {e}"
+                )
+                if tentativa == self._tentativas:
+                    self.descartadas += len(lote)
+                    return
+                time.sleep(0.1 * tentativa)
+            finally:
+                session.close()
+
+        latencia = time.perf_counter() - inicio
+        self.gravadas += len(lote)
+        self.lotes += 1
+        self.ultima_latencia = latencia
+        self.latencia_maxima = max(self.latencia_maxima, latencia)
+        self._latencia_total += latencia
@@ -0,0 +1,92 @@
+"""Modo de respostas assíncronas do /webhook com o canal de envio falso"""
+
+import pytest
+
+from stub_llm import iniciar_stub
+
+
+@pytest.fixture(scope="module")
+def aplicacao(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp("async_replies")
+    stub = iniciar_stub(latencia=0.05)
+    # Main lê a configuração do ambiente ao ser importado; o ambiente original
+    # volta ao final do módulo
+    with pytest.MonkeyPatch.context() as ambiente:
+        for nome, valor in {
+            "ASYNC_REPLIES": "1",
+            "OUTBOUND_SENDER": "fake",
+            "DATABASE_URL": f"sqlite:///{pasta / 'alunos.db'}",
+            "LLM_BASE_URL": f"http://127.0.0.1:{stub.server_address[1]}/v1",
+            "OPENROUTER_API_KEY": "stub",
+            "SEARCH_INDEX_PATH": str(pasta / "indice_busca"),
+            "RETRIEVAL_ENABLED": "0",
+            "PRELOAD_MODULES": "0",
+        }.items():
+            ambiente.setenv(nome, valor)
+        from fastapi.testclient import TestClient
+
+        import Main
+
+        try:
+            with TestClient(Main.app) as cliente:
+                yield Main, cliente
+        finally:
+            stub.shutdown()
+            stub.server_close()
+
+
+def enviar(cliente, numero, texto, sid):
+    resposta = cliente.post(
+        "/webhook", data={"Body": texto, "From": numero, "MessageSid": sid}
+    )
+    assert resposta.status_code == 200
+    # O webhook só confirma o recebimento; a resposta segue pelo canal de envio
+    assert resposta.text == ""
+
+
+def respostas_para(Main, numero):
+    return [texto for destino, texto in Main.REPLY_SENDER.enviadas if destino == numero]
+
+
+def test_resposta_chega_ao_envio_falso(aplicacao):
+    Main, cliente = aplicacao
+
+    enviar(cliente, "whatsapp:+5511000000001", "oi", "SM-envio-1")
+    assert Main.REPLY_QUEUE.aguardar(10)
+
+    respostas = respostas_para(Main, "whatsapp:+5511000000001")
+    assert len(respostas) == 1
+    assert "Qual o seu nome?" in respostas[0]
+
+
+def test_respostas_de_cada_aluno_seguem_a_ordem_das_mensagens(aplicacao):
+    Main, cliente = aplicacao
+    alunos = ["whatsapp:+5511000000002", "whatsapp:+5511000000003"]
+    mensagens = ["oi", "meu nome é Ana", "Administração", "5º semestre"]
+
+    # Mensagens dos dois alunos intercaladas, sem esperar as respostas
+    for turno, texto in enumerate(mensagens):
+        for numero in alunos:
+            enviar(cliente, numero, texto, f"SM-ordem-{numero[-1]}-{turno}")
+    assert Main.REPLY_QUEUE.aguardar(10)
+
+    for numero in alunos:
+        respostas = respostas_para(Main, numero)
+        assert len(respostas) == 4
+        assert "Qual o seu nome?" in respostas[0]
+        assert "Prazer em te conhecer, Ana" in respostas[1]
+        assert "Qual semestre" in respostas[2]
+        assert "interesses" in respostas[3]
+
+
+def test_messagesid_repetido_e_descartado(aplicacao):
+    Main, cliente = aplicacao
+    numero = "whatsapp:+5511000000004"
+    duplicadas = Main.INBOUND_DEDUP.duplicadas
+
+    enviar(cliente, numero, "oi", "SM-duplicada")
+    enviar(cliente, numero, "oi", "SM-duplicada")  # reenvio do provedor
+    assert Main.REPLY_QUEUE.aguardar(10)
+
+    assert len(respostas_para(Main, numero)) == 1
+    assert Main.INBOUND_DEDUP.duplicadas == duplicadas + 1
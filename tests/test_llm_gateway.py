@@ -0,0 +1,126 @@
+"""GatewayIA contra o stub local da API (benchmarks/stub_llm.py)"""
+
+import threading
+import time
+
+import openai
+import pytest
+
+from lib.llm_gateway import GatewayIA
+from stub_llm import iniciar_stub
+
+
+@pytest.fixture
+def stub():
+    servidor = iniciar_stub(latencia=0.0)
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def criar_gateway(stub, **opcoes):
+    client = openai.OpenAI(
+        api_key="stub",
+        base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        max_retries=0,
+        timeout=5,
+    )
+    return GatewayIA(client, **opcoes)
+
+
+def perguntar(gateway, texto, **opcoes):
+    resposta = gateway.completar(
+        model="stub", messages=[{"role": "user", "content": texto}], **opcoes
+    )
+    return resposta.choices[0].message.content
+
+
+def em_paralelo(funcao, quantidade):
+    """Executa `funcao` em `quantidade` threads; devolve resultados ou exceções"""
+    resultados = [None] * quantidade
+
+    def executar(indice):
+        try:
+            resultados[indice] = funcao()
+        except Exception as e:
+            resultados[indice] = e
+
+    threads = [
+        threading.Thread(target=executar, args=(indice,))
+        for indice in range(quantidade)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultados
+
+
+def test_resposta_em_cache_expira_apos_ttl(stub):
+    gateway = criar_gateway(stub, ttl=0.2)
+
+    perguntar(gateway, "O que é MEI?")
+    perguntar(gateway, "o que é mei")  # mesmo prompt normalizado
+    assert stub.requisicoes == 1
+    assert gateway.hits == 1
+
+    time.sleep(0.3)
+    perguntar(gateway, "O que é MEI?")
+    assert stub.requisicoes == 2
+
+
+def test_cache_descarta_o_menos_usado_ao_atingir_capacidade(stub):
+    gateway = criar_gateway(stub, capacidade=2)
+
+    perguntar(gateway, "pergunta a")
+    perguntar(gateway, "pergunta b")
+    perguntar(gateway, "pergunta a")  # "b" passa a ser a menos usada
+    perguntar(gateway, "pergunta c")  # descarta "b"
+    assert stub.requisicoes == 3
+    assert gateway.estatisticas()["em_cache"] == 2
+
+    perguntar(gateway, "pergunta a")
+    assert stub.requisicoes == 3
+    perguntar(gateway, "pergunta b")
+    assert stub.requisicoes == 4
+
+
+def test_chamadas_identicas_simultaneas_viram_uma_requisicao(stub):
+    stub.latencia = 0.3
+    gateway = criar_gateway(stub)
+
+    respostas = em_paralelo(lambda: perguntar(gateway, "Como abrir um CNPJ?"), 5)
+
+    assert stub.requisicoes == 1
+    assert gateway.coalescidas == 4
+    assert len(set(respostas)) == 1
+
+
+def test_erro_da_api_chega_a_todas_as_chamadas_em_espera(stub):
+    stub.latencia = 0.3
+    stub.status_erro = 500
+    gateway = criar_gateway(stub)
+
+    resultados = em_paralelo(lambda: perguntar(gateway, "pergunta com erro"), 3)
+
+    assert stub.requisicoes == 1
+    assert all(isinstance(r, openai.InternalServerError) for r in resultados)
+    assert gateway.erros == 1
+    assert gateway.estatisticas()["em_cache"] == 0
+
+    # O erro não fica em cache: a próxima chamada vai à API
+    stub.status_erro = None
+    stub.latencia = 0.0
+    perguntar(gateway, "pergunta com erro")
+    assert stub.requisicoes == 2
+
+
+def test_usar_cache_false_sempre_chama_a_api(stub):
+    gateway = criar_gateway(stub)
+
+    perguntar(gateway, "resumo do aluno", usar_cache=False)
+    perguntar(gateway, "resumo do aluno", usar_cache=False)
+
+    assert stub.requisicoes == 2
+    assert gateway.hits == 0
+    assert gateway.estatisticas()["em_cache"] == 0
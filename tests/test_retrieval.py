@@ -0,0 +1,32 @@
+"""Gravação e troca de versões do índice de busca"""
+
+import os
+
+from lib.retrieval import PASSAGEM_PDF, IndiceBusca
+
+
+def construir(*textos):
+    passagens = [
+        {"fonte": "modulo_1.pdf", "tipo": PASSAGEM_PDF, "texto": t} for t in textos
+    ]
+    return IndiceBusca.construir(passagens)
+
+
+def test_nova_versao_nao_altera_o_indice_aberto(tmp_path):
+    pasta = str(tmp_path / "indice")
+    construir("o MEI fatura até 81 mil por ano").salvar(pasta)
+    aberto = IndiceBusca.carregar(pasta)
+
+    construir("o CNPJ é o cadastro da empresa", "a DAS é paga todo mês").salvar(pasta)
+    construir("o contador cuida da escrituração").salvar(pasta)
+
+    # O índice aberto continua lendo a própria versão, já removida do disco
+    assert aberto.buscar("MEI")[0][1]["texto"].startswith("o MEI")
+    assert aberto.substituido(pasta)
+
+    atual = IndiceBusca.carregar(pasta)
+    assert not atual.substituido(pasta)
+    assert atual.buscar("contador")[0][1]["texto"].startswith("o contador")
+    # Só a versão em uso e a anterior ficam na pasta
+    versoes = [nome for nome in os.listdir(pasta) if nome.startswith("versao-")]
+    assert len(versoes) == 2
@@ -0,0 +1,26 @@
+"""Travas por espaço dos backends de lib/shared_cache.py"""
+
+import zlib
+
+from lib.shared_cache import ESPACO_CACHE, ESPACO_INDICE, BackendSQLite
+
+
+def chave_na_mesma_faixa(chave, prefixo):
+    faixa = zlib.crc32(chave.encode()) % 1024
+    return next(
+        f"{prefixo}{indice}"
+        for indice in range(100000)
+        if zlib.crc32(f"{prefixo}{indice}".encode()) % 1024 == faixa
+    )
+
+
+def test_travas_de_espacos_diferentes_podem_ser_aninhadas(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "cache.db"))
+    # Mesma faixa que "indice_busca", como o texto de um PDF lido na construção
+    chave_pdf = chave_na_mesma_faixa("indice_busca", "texto_pdf:/modulos_pdf/")
+
+    with backend.travar("indice_busca", ESPACO_INDICE):
+        with backend.travar(chave_pdf, ESPACO_CACHE):
+            backend.gravar(chave_pdf, "texto")
+
+    assert backend.obter(chave_pdf) == "texto"
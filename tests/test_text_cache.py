@@ -0,0 +1,51 @@
+"""Cache de texto e trechos dos módulos (lib/text_cache.py)"""
+
+import sys
+import threading
+import time
+
+from lib.text_cache import CacheTextoModulos
+
+
+def test_leituras_simultaneas_extraem_o_pdf_uma_vez(tmp_path):
+    caminho = tmp_path / "modulo_1.pdf"
+    caminho.write_bytes(b"%PDF")
+    extracoes = []
+
+    def extrair(caminho_pdf):
+        extracoes.append(caminho_pdf)
+        time.sleep(0.2)
+        return "texto do módulo"
+
+    cache = CacheTextoModulos(extrair)
+    resultados = []
+    threads = [
+        threading.Thread(target=lambda: resultados.append(cache.obter(str(caminho))))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(extracoes) == 1
+    assert resultados == ["texto do módulo"] * 5
+    assert cache.coalescidas == 4
+
+
+def test_trechos_sao_guardados_com_a_entrada_e_contam_no_limite(tmp_path):
+    caminho = tmp_path / "modulo_1.pdf"
+    caminho.write_bytes(b"%PDF")
+    texto = "Primeiro parágrafo do módulo.\n" * 200
+    cache = CacheTextoModulos(lambda caminho_pdf: texto)
+
+    trechos = cache.trechos(str(caminho))
+    bytes_so_texto = sys.getsizeof(texto)
+    assert trechos and cache.trechos(str(caminho)) is trechos
+    assert cache.estatisticas()["bytes"] > bytes_so_texto
+
+    # Com limite para o texto mas não para os trechos, a entrada é descartada
+    pequeno = CacheTextoModulos(lambda caminho_pdf: texto, max_bytes=bytes_so_texto)
+    pequeno.trechos(str(caminho))
+    assert pequeno.estatisticas()["bytes"] <= bytes_so_texto
+    assert pequeno.evictions == 1